@@ -1,43 +1,134 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_file, jsonify
+from flask import Flask, Blueprint, current_app, render_template, request, redirect, url_for, session, flash, \
+    jsonify, Response, stream_with_context, send_from_directory, has_request_context
+from flask.cli import with_appcontext
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
-from flask_mail import Mail
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
+from werkzeug.datastructures import MultiDict
 import os
 import io
+import csv
+import json
+import gzip
+import hashlib
+import re
 import secrets
-import string
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from datetime import datetime, timedelta
 import logging
-
-app = Flask(__name__)
-app.secret_key = "super_secret_key"  # change this in production!
-
-# Logging setup
-logging.basicConfig(level=logging.INFO)
+import click
+from sqlalchemy import func, event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from hashing import PasswordHasher, HasherBusy
+from storage import save_upload, is_content_addressed, UploadRejected
+from metrics import Metrics
+from assets import Assets
+from notifications import NotificationDispatcher
+
+# The app is built by create_app() at the bottom of this file. Importing the
+# module has no side effects: no config is read, no engine is created and no
+# schema is touched. PDF export and Flask-Mail are imported on first use.
 logger = logging.getLogger(__name__)
 
-# ---------------- Upload / Export Configuration ----------------
+db = SQLAlchemy()
+hasher = PasswordHasher()
+metrics = Metrics()
+assets = Assets()
+
 UPLOAD_FOLDER = 'static/uploads'
 EXPORT_FOLDER = 'exports'
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(EXPORT_FOLDER, exist_ok=True)
-
-# ---------------- Database Configuration ----------------
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///users.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
-
-# ---------------- Mail Configuration (unused but kept) ----------------
-app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-app.config['MAIL_PORT'] = 587
-app.config['MAIL_USE_TLS'] = True
-app.config['MAIL_USERNAME'] = 'your_email@gmail.com'
-app.config['MAIL_PASSWORD'] = 'your_app_password'
-mail = Mail(app)
+DOCUMENT_CACHE_SECONDS = 365 * 24 * 3600
+
+
+def default_config():
+    """Configuration defaults. Environment variables are read when the app is created, not on import."""
+    return {
+        'SECRET_KEY': "super_secret_key",  # change this in production!
+
+        # ---------------- Uploads ----------------
+        'UPLOAD_FOLDER': UPLOAD_FOLDER,
+        'UPLOAD_MAX_BYTES': 10 * 1024 * 1024,
+        'UPLOAD_ALLOWED_EXTENSIONS': {'pdf', 'png', 'jpg', 'jpeg', 'doc', 'docx'},
+
+        # ---------------- Database ----------------
+        # DATABASE_URL switches to another database (e.g. postgresql://...) with a
+        # pooled engine; `flask migrate-db` creates its schema. DATABASE_PROFILE=production (the default) tunes SQLite for
+        # several gunicorn workers; 'default' leaves SQLite's own settings alone.
+        'SQLALCHEMY_DATABASE_URI': os.environ.get('DATABASE_URL', 'sqlite:///users.db'),
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'DATABASE_PROFILE': os.environ.get('DATABASE_PROFILE', 'production'),
+        'SQLITE_PRAGMAS': {
+            'journal_mode': 'WAL',         # readers no longer block behind writers
+            'synchronous': 'NORMAL',       # safe with WAL, fsyncs only at checkpoints
+            'busy_timeout': 5000,          # ms to wait for the write lock before "database is locked"
+            'mmap_size': 256 * 1024 * 1024,
+            'cache_size': -64 * 1024,      # negative = KiB, i.e. 64 MB page cache per connection
+        },
+        'DB_POOL_SIZE': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'DB_MAX_OVERFLOW': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+
+        # ---------------- Password hashing ----------------
+        # Changing the method rehashes each user's password on their next login.
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000000',
+
+        # ---------------- Request metrics ----------------
+        # Served on /metrics to admins, or to scrapers sending "Authorization: Bearer <METRICS_TOKEN>".
+        'METRICS_TOKEN': os.environ.get('METRICS_TOKEN'),
+
+        # ---------------- Caches and background work ----------------
+        'STATS_CACHE_TTL': 60,
+        'DATA_VERSION_CACHE_TTL': 1.0,
+        'EXPORT_JOB_WORKERS': 2,
+        # a queued or running export whose worker has not reported for this long is marked failed
+        'EXPORT_JOB_STALE_SECONDS': 300,
+
+        # ---------------- Mail ----------------
+        # Leave decisions are mailed through the outbox (see notifications.py).
+        # MAIL_SERVER=localhost MAIL_PORT=1025 MAIL_USE_TLS=0 points it at a local test server.
+        'MAIL_SERVER': os.environ.get('MAIL_SERVER', 'smtp.gmail.com'),
+        'MAIL_PORT': int(os.environ.get('MAIL_PORT', 587)),
+        'MAIL_USE_TLS': os.environ.get('MAIL_USE_TLS', '1') == '1',
+        'MAIL_USERNAME': os.environ.get('MAIL_USERNAME', 'your_email@gmail.com'),
+        'MAIL_PASSWORD': os.environ.get('MAIL_PASSWORD', 'your_app_password'),
+        'MAIL_DEFAULT_SENDER': os.environ.get('MAIL_DEFAULT_SENDER', 'your_email@gmail.com'),
+        'OUTBOX_DISPATCHER': os.environ.get('OUTBOX_DISPATCHER', 'thread'),
+    }
+
+
+def _sqlite_on_connect(pragmas, dbapi_connection, connection_record):
+    # let SQLAlchemy's "begin" hook below issue BEGIN instead of the sqlite3 module
+    dbapi_connection.isolation_level = None
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+
+# these POST routes hash passwords or receive an upload; holding the write lock
+# across a hash or a slow client would stall every other writer. They end their
+# read transaction before the slow part and write in a fresh one: once another
+# connection has committed, SQLite refuses to turn a read transaction into a
+# write, without waiting on busy_timeout.
+DEFERRED_WRITE_ENDPOINTS = {'auth.login', 'auth.forgot_password', 'admin.admin_users', 'admin.admin_import_users',
+                            'student.student_dashboard'}
+READ_ONLY_METHODS = ('GET', 'HEAD', 'OPTIONS')   # never take the write lock
+
+
+def _sqlite_on_begin(conn):
+    # SQLite allows one writer at a time. Requests that write take the write lock
+    # up front, so concurrent writers queue on busy_timeout instead of failing
+    # when a read transaction tries to upgrade to a write. Outside requests a
+    # transaction asks for it with db.session.connection(execution_options={'write_lock': True}).
+    in_writing_request = has_request_context() and request.method not in READ_ONLY_METHODS \
+        and request.endpoint not in DEFERRED_WRITE_ENDPOINTS
+    if in_writing_request or conn.get_execution_options().get('write_lock'):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+    else:
+        conn.exec_driver_sql("BEGIN")
+
 
 # -------------------- Models --------------------
 class User(db.Model):
@@ -47,6 +138,10 @@ class User(db.Model):
     password = db.Column(db.String(150), nullable=False)
     role = db.Column(db.String(50), nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_user_role', 'role'),
+    )
+
     leaves = db.relationship('Leave', backref='user', lazy=True,
                              cascade='all, delete-orphan', passive_deletes=True)
     attendance = db.relationship('Attendance', backref='student', lazy=True,
@@ -64,6 +159,11 @@ class Leave(db.Model):
     status = db.Column(db.String(20), default='Pending')
     approved_by = db.Column(db.String(150), nullable=True)
 
+    __table_args__ = (
+        db.Index('ix_leave_student_id', 'student_id', 'id'),
+        db.Index('ix_leave_status', 'status', 'id'),
+    )
+
 
 class Attendance(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -71,16 +171,587 @@ class Attendance(db.Model):
     percentage = db.Column(db.Float, nullable=False, default=0.0)
     updated_by = db.Column(db.String(150), nullable=False)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    present_days = db.Column(db.Integer, nullable=True)
+    total_days = db.Column(db.Integer, nullable=True)
+
+    __table_args__ = (
+        # covers the "latest record per student" lookup without touching the table
+        db.Index('ix_attendance_student_latest', 'student_id', 'updated_at', 'id', 'percentage'),
+    )
+
+
+class AttendanceEntry(db.Model):
+    """One row per student per lecture: the attendance ledger."""
+    __tablename__ = 'attendance_entry'
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    lecture = db.Column(db.String(100), nullable=False)
+    present = db.Column(db.Boolean, nullable=False)
+    recorded_by = db.Column(db.String(150), nullable=False)
+    recorded_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'lecture', name='uq_attendance_entry_student_lecture'),
+    )
+
+
+class AttendanceRollup(db.Model):
+    """
+    Current attendance per student, kept up to date in the same transaction as
+    every snapshot update and ledger entry, so reads are a primary-key lookup.
+    The counts are the latest snapshot's totals plus the ledger entries created
+    after it (AttendanceEntry.id > ledger_from).
+    """
+    __tablename__ = 'attendance_rollup'
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    present_count = db.Column(db.Integer, nullable=False, default=0)
+    total_count = db.Column(db.Integer, nullable=False, default=0)
+    percentage = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    ledger_from = db.Column(db.Integer, nullable=False, default=0, server_default='0')   # entries up to this id are in the snapshot
+
+    __table_args__ = (
+        db.Index('ix_attendance_rollup_percentage', 'percentage'),
+    )
+
+
+class SchemaVersion(db.Model):
+    """The last applied entry of MIGRATIONS, in a single row."""
+    __tablename__ = 'schema_version'
+    version = db.Column(db.Integer, primary_key=True)
+
+
+class DataVersion(db.Model):
+    """Per-table change counter, bumped by triggers on every insert, update and delete."""
+    __tablename__ = 'data_version'
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ExportJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    dataset = db.Column(db.String(50), nullable=False)
+    fmt = db.Column(db.String(10), nullable=False)
+    params = db.Column(db.Text, nullable=False, default='{}')
+    data_version = db.Column(db.String(100), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=True)
+    filename = db.Column(db.String(150), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_by = db.Column(db.String(150), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    heartbeat_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow)   # last sign of life from the worker
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_export_job_lookup', 'dataset', 'fmt', 'params', 'data_version', 'status'),
+    )
+
+
+class OutboxMessage(db.Model):
+    """A notification mail waiting for the dispatcher, written in the same commit as its cause."""
+    __tablename__ = 'outbox_message'
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(150), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')   # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_outbox_message_due', 'status', 'next_attempt_at'),
+    )
+
+
+class AttendanceBucket(db.Model):
+    """Students per attendance band of ATTENDANCE_BUCKET_WIDTH points, kept current by triggers."""
+    __tablename__ = 'attendance_bucket'
+    bucket = db.Column(db.Integer, primary_key=True)   # 0 = 0-5%, 1 = 5-10%, ... last = 95-100%
+    students = db.Column(db.Integer, nullable=False, default=0)
+
+
+class AnalyticsCounter(db.Model):
+    """Running totals ('students', 'leaves:Approved', 'leave_days:Approved', ...), kept current by triggers."""
+    __tablename__ = 'analytics_counter'
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+class FacultyLeaveStats(db.Model):
+    """Leave decisions per Leave.approved_by, kept current by triggers."""
+    __tablename__ = 'faculty_leave_stats'
+    approved_by = db.Column(db.String(150), primary_key=True)
+    approved = db.Column(db.Integer, nullable=False, default=0)
+    rejected = db.Column(db.Integer, nullable=False, default=0)
+    approved_days = db.Column(db.Integer, nullable=False, default=0)
+
+
+notifications = NotificationDispatcher(db, OutboxMessage)
+
+
+# -------------------- Schema migrations --------------------
+# Each migration runs once, in order, and the applied version is stored in the
+# schema_version table. Only ever append to this list. Migrations receive the
+# connection and branch on conn.dialect.name where SQLite and server databases
+# differ; the FTS5 search index and the trigger-maintained analytics rollups are
+# SQLite-only, and api_search / attendance_analytics fall back to plain queries
+# elsewhere.
+def _migration_lookup_indexes(conn):
+    for index in (
+        *User.__table__.indexes,
+        *Leave.__table__.indexes,
+        *Attendance.__table__.indexes,
+    ):
+        if index.name in ('ix_user_role', 'ix_leave_student_id', 'ix_leave_status',
+                          'ix_attendance_student_latest'):
+            index.create(conn, checkfirst=True)
+
+
+def _add_version_triggers(conn, tables):
+    if conn.dialect.name == 'postgresql':
+        conn.exec_driver_sql(
+            "CREATE OR REPLACE FUNCTION bump_data_version() RETURNS trigger AS $$ BEGIN "
+            "UPDATE data_version SET version = version + 1 WHERE name = TG_TABLE_NAME; RETURN NULL; "
+            "END $$ LANGUAGE plpgsql")
+    for table in tables:
+        conn.exec_driver_sql(
+            f"INSERT INTO data_version (name, version) VALUES ('{table}', 0) ON CONFLICT (name) DO NOTHING")
+        if conn.dialect.name == 'postgresql':
+            conn.exec_driver_sql(f'DROP TRIGGER IF EXISTS trg_{table}_version ON "{table}"')
+            conn.exec_driver_sql(
+                f'CREATE TRIGGER trg_{table}_version AFTER INSERT OR UPDATE OR DELETE ON "{table}" '
+                f"FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version()")
+            continue
+        for op in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.exec_driver_sql(
+                f'CREATE TRIGGER IF NOT EXISTS trg_{table}_{op.lower()}_version AFTER {op} ON "{table}" '
+                f"BEGIN UPDATE data_version SET version = version + 1 WHERE name = '{table}'; END"
+            )
+
+
+def _migration_data_version_triggers(conn):
+    DataVersion.__table__.create(conn, checkfirst=True)
+    _add_version_triggers(conn, ('user', 'leave', 'attendance'))
+
+
+def _migration_attendance_ledger(conn):
+    columns = {c['name'] for c in db.inspect(conn).get_columns('attendance')}
+    for column in ('present_days', 'total_days'):
+        if column not in columns:
+            conn.exec_driver_sql(f"ALTER TABLE attendance ADD COLUMN {column} INTEGER")
+    AttendanceEntry.__table__.create(conn, checkfirst=True)
+    AttendanceRollup.__table__.create(conn, checkfirst=True)
+    # seed the rollup from each student's latest snapshot; snapshots written before
+    # this migration only kept the percentage, so their counts start at 0
+    conn.exec_driver_sql("""
+        INSERT INTO attendance_rollup (student_id, present_count, total_count, percentage, updated_at)
+        SELECT student_id, COALESCE(present_days, 0), COALESCE(total_days, 0), percentage, updated_at
+        FROM (SELECT a.*, ROW_NUMBER() OVER (PARTITION BY student_id ORDER BY updated_at DESC, id DESC) AS rn
+              FROM attendance a) latest
+        WHERE rn = 1
+        ON CONFLICT (student_id) DO NOTHING
+    """)
+    _add_version_triggers(conn, ('attendance_rollup',))
+
+
+# table -> indexed columns; leave_fts and user_fts are external-content FTS5
+# indexes over these tables, kept in sync by the triggers below
+FTS_TABLES = {
+    'leave': ('name', 'email', 'reason'),
+    'user': ('name', 'email'),
+}
+
+
+def _migration_fts_search(conn):
+    if conn.dialect.name != 'sqlite':
+        return
+    for table, columns in FTS_TABLES.items():
+        cols = ', '.join(columns)
+        new_values = ', '.join(f'new.{c}' for c in columns)
+        old_values = ', '.join(f'old.{c}' for c in columns)
+        fts = f'{table}_fts'
+        conn.exec_driver_sql(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{table}', "
+            f"content_rowid='id', tokenize='unicode61 remove_diacritics 2')")
+        conn.exec_driver_sql(
+            f'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON "{table}" BEGIN '
+            f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values}); END")
+        conn.exec_driver_sql(
+            f'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON "{table}" BEGIN '
+            f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values}); END")
+        # only edits of indexed columns touch the index, not status changes
+        conn.exec_driver_sql(
+            f'CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON "{table}" BEGIN '
+            f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values}); "
+            f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values}); END")
+        conn.exec_driver_sql(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def _migration_outbox(conn):
+    OutboxMessage.__table__.create(conn, checkfirst=True)
+
+
+ATTENDANCE_BUCKET_WIDTH = 5
+ATTENDANCE_BUCKETS = 100 // ATTENDANCE_BUCKET_WIDTH
+
+
+def _bucket_sql(row):
+    return f"MAX(0, MIN(CAST({row}.percentage / {ATTENDANCE_BUCKET_WIDTH} AS INTEGER), {ATTENDANCE_BUCKETS - 1}))"
+
+
+def _leave_analytics_sql(row, sign):
+    """Statements that add (sign '+') or remove (sign '-') one leave row from the analytics rollups."""
+    status = f"COALESCE({row}.status, 'Pending')"
+    counters = (f"UPDATE analytics_counter SET value = value {sign} "
+                f"CASE WHEN name LIKE 'leaves:%' THEN 1 ELSE {row}.days END "
+                f"WHERE name IN ('leaves:' || {status}, 'leave_days:' || {status});")
+    if sign == '-':
+        faculty = (f"UPDATE faculty_leave_stats SET approved = approved - ({row}.status = 'Approved'), "
+                   f"rejected = rejected - ({row}.status = 'Rejected'), "
+                   f"approved_days = approved_days - CASE WHEN {row}.status = 'Approved' THEN {row}.days ELSE 0 END "
+                   f"WHERE approved_by = {row}.approved_by AND {row}.status IN ('Approved', 'Rejected');")
+    else:
+        faculty = (f"INSERT INTO faculty_leave_stats (approved_by, approved, rejected, approved_days) "
+                   f"SELECT {row}.approved_by, {row}.status = 'Approved', {row}.status = 'Rejected', "
+                   f"CASE WHEN {row}.status = 'Approved' THEN {row}.days ELSE 0 END "
+                   f"WHERE {row}.approved_by IS NOT NULL AND {row}.status IN ('Approved', 'Rejected') "
+                   f"ON CONFLICT (approved_by) DO UPDATE SET approved = approved + excluded.approved, "
+                   f"rejected = rejected + excluded.rejected, approved_days = approved_days + excluded.approved_days;")
+    return f"{counters} {faculty}"
+
+
+def _migration_analytics_rollups(conn):
+    if conn.dialect.name != 'sqlite':
+        return
+    for model in (AttendanceBucket, AnalyticsCounter, FacultyLeaveStats):
+        model.__table__.create(conn, checkfirst=True)
+
+    # backfill from the current data
+    conn.exec_driver_sql("DELETE FROM attendance_bucket")
+    conn.exec_driver_sql(f"""
+        INSERT INTO attendance_bucket (bucket, students)
+        SELECT {_bucket_sql('r')} AS b, COUNT(*) FROM attendance_rollup r GROUP BY b
+    """)
+    for bucket in range(ATTENDANCE_BUCKETS):
+        conn.exec_driver_sql(f"INSERT OR IGNORE INTO attendance_bucket (bucket, students) VALUES ({bucket}, 0)")
+    conn.exec_driver_sql("DELETE FROM analytics_counter")
+    conn.exec_driver_sql(
+        """INSERT INTO analytics_counter (name, value) SELECT 'students', COUNT(*) FROM "user" WHERE lower(role) = 'student'""")
+    for status in LEAVE_STATUSES:
+        conn.exec_driver_sql(f"""
+            INSERT INTO analytics_counter (name, value)
+            SELECT 'leaves:{status}', COUNT(*) FROM leave WHERE COALESCE(status, 'Pending') = '{status}'
+            UNION ALL
+            SELECT 'leave_days:{status}', COALESCE(SUM(days), 0) FROM leave WHERE COALESCE(status, 'Pending') = '{status}'
+        """)
+    conn.exec_driver_sql("DELETE FROM faculty_leave_stats")
+    conn.exec_driver_sql("""
+        INSERT INTO faculty_leave_stats (approved_by, approved, rejected, approved_days)
+        SELECT approved_by, SUM(status = 'Approved'), SUM(status = 'Rejected'),
+               SUM(CASE WHEN status = 'Approved' THEN days ELSE 0 END)
+        FROM leave WHERE approved_by IS NOT NULL AND status IN ('Approved', 'Rejected')
+        GROUP BY approved_by
+    """)
+
+    triggers = {
+        ('attendance_rollup', 'INSERT'):
+            f"UPDATE attendance_bucket SET students = students + 1 WHERE bucket = {_bucket_sql('new')};",
+        ('attendance_rollup', 'DELETE'):
+            f"UPDATE attendance_bucket SET students = students - 1 WHERE bucket = {_bucket_sql('old')};",
+        ('attendance_rollup', 'UPDATE OF percentage'):
+            f"UPDATE attendance_bucket SET students = students + (bucket = {_bucket_sql('new')}) "
+            f"- (bucket = {_bucket_sql('old')}) WHERE bucket IN ({_bucket_sql('old')}, {_bucket_sql('new')});",
+        ('user', 'INSERT'):
+            "UPDATE analytics_counter SET value = value + 1 WHERE name = 'students' AND lower(new.role) = 'student';",
+        ('user', 'DELETE'):
+            "UPDATE analytics_counter SET value = value - 1 WHERE name = 'students' AND lower(old.role) = 'student';",
+        ('user', 'UPDATE OF role'):
+            "UPDATE analytics_counter SET value = value + (lower(new.role) = 'student') "
+            "- (lower(old.role) = 'student') WHERE name = 'students';",
+        ('leave', 'INSERT'): _leave_analytics_sql('new', '+'),
+        ('leave', 'DELETE'): _leave_analytics_sql('old', '-'),
+        ('leave', 'UPDATE OF status, approved_by, days'):
+            f"{_leave_analytics_sql('old', '-')} {_leave_analytics_sql('new', '+')}",
+    }
+    for (table, event_), body in triggers.items():
+        name = f"trg_{table}_{event_.split()[0].lower()}_analytics"
+        conn.exec_driver_sql(f'CREATE TRIGGER IF NOT EXISTS {name} AFTER {event_} ON "{table}" BEGIN {body} END')
+
+
+def _migration_export_job_heartbeat(conn):
+    if 'heartbeat_at' not in {c['name'] for c in db.inspect(conn).get_columns('export_job')}:
+        conn.exec_driver_sql("ALTER TABLE export_job ADD COLUMN heartbeat_at DATETIME")
+
+
+def _migration_rollup_ledger_from(conn):
+    if 'ledger_from' not in {c['name'] for c in db.inspect(conn).get_columns('attendance_rollup')}:
+        conn.exec_driver_sql("ALTER TABLE attendance_rollup ADD COLUMN ledger_from INTEGER NOT NULL DEFAULT 0")
+    # entries recorded up to each student's latest snapshot are part of it
+    conn.exec_driver_sql("""
+        UPDATE attendance_rollup SET ledger_from = COALESCE((
+            SELECT MAX(e.id) FROM attendance_entry e
+            WHERE e.student_id = attendance_rollup.student_id
+              AND e.recorded_at <= (SELECT MAX(a.updated_at) FROM attendance a
+                                    WHERE a.student_id = attendance_rollup.student_id)), 0)
+    """)
+    # corrections used to be applied on top of snapshots, which could leave present above total
+    conn.exec_driver_sql("""
+        UPDATE attendance_rollup SET present_count = MIN(MAX(present_count, 0), total_count),
+            percentage = CASE WHEN total_count > 0
+                              THEN ROUND(100.0 * MIN(MAX(present_count, 0), total_count) / total_count, 2)
+                              ELSE 0.0 END
+        WHERE present_count < 0 OR present_count > total_count
+    """ if conn.dialect.name == 'sqlite' else """
+        UPDATE attendance_rollup SET present_count = LEAST(GREATEST(present_count, 0), total_count),
+            percentage = CASE WHEN total_count > 0
+                              THEN ROUND(100.0 * LEAST(GREATEST(present_count, 0), total_count) / total_count, 2)
+                              ELSE 0.0 END
+        WHERE present_count < 0 OR present_count > total_count
+    """)
+
+
+def _migration_student_attendance_buckets(conn):
+    if conn.dialect.name != 'sqlite':
+        return
+    # attendance bands counted every rollup row, so a student moved to faculty
+    # stayed in them; count students only and move rows across on role changes
+    is_student = "(SELECT lower(role) FROM \"user\" WHERE id = {row}.student_id) = 'student'"
+    rollup_of = "(SELECT {bucket} FROM attendance_rollup r WHERE r.student_id = {row}.id)".format(
+        bucket=_bucket_sql('r'), row='{row}')
+    triggers = {
+        ('attendance_rollup', 'INSERT'):
+            f"UPDATE attendance_bucket SET students = students + 1 WHERE bucket = {_bucket_sql('new')} "
+            f"AND {is_student.format(row='new')};",
+        ('attendance_rollup', 'DELETE'):
+            f"UPDATE attendance_bucket SET students = students - 1 WHERE bucket = {_bucket_sql('old')} "
+            f"AND {is_student.format(row='old')};",
+        ('attendance_rollup', 'UPDATE OF percentage'):
+            f"UPDATE attendance_bucket SET students = students + (bucket = {_bucket_sql('new')}) "
+            f"- (bucket = {_bucket_sql('old')}) WHERE bucket IN ({_bucket_sql('old')}, {_bucket_sql('new')}) "
+            f"AND {is_student.format(row='new')};",
+        ('user', 'INSERT'):
+            "UPDATE analytics_counter SET value = value + 1 WHERE name = 'students' AND lower(new.role) = 'student'; "
+            f"UPDATE attendance_bucket SET students = students + 1 WHERE bucket = {rollup_of.format(row='new')} "
+            "AND lower(new.role) = 'student';",
+        ('user', 'DELETE'):
+            "UPDATE analytics_counter SET value = value - 1 WHERE name = 'students' AND lower(old.role) = 'student'; "
+            f"UPDATE attendance_bucket SET students = students - 1 WHERE bucket = {rollup_of.format(row='old')} "
+            "AND lower(old.role) = 'student';",
+        ('user', 'UPDATE OF role'):
+            "UPDATE analytics_counter SET value = value + (lower(new.role) = 'student') "
+            "- (lower(old.role) = 'student') WHERE name = 'students'; "
+            "UPDATE attendance_bucket SET students = students + (lower(new.role) = 'student') "
+            f"- (lower(old.role) = 'student') WHERE bucket = {rollup_of.format(row='new')};",
+    }
+    for (table, event_), body in triggers.items():
+        name = f"trg_{table}_{event_.split()[0].lower()}_analytics"
+        conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+        conn.exec_driver_sql(f'CREATE TRIGGER {name} AFTER {event_} ON "{table}" BEGIN {body} END')
+
+    conn.exec_driver_sql(f"""
+        UPDATE attendance_bucket SET students = (
+            SELECT COUNT(*) FROM attendance_rollup r JOIN "user" u ON u.id = r.student_id
+            WHERE lower(u.role) = 'student' AND {_bucket_sql('r')} = attendance_bucket.bucket)
+    """)
+
+
+MIGRATIONS = [
+    (1, "indexes on user.role, leave.student_id/status and latest attendance", _migration_lookup_indexes),
+    (2, "data_version table and change-counting triggers", _migration_data_version_triggers),
+    (3, "attendance ledger, per-student rollup and snapshot day counts", _migration_attendance_ledger),
+    (4, "FTS5 search indexes over leaves and users", _migration_fts_search),
+    (5, "notification outbox", _migration_outbox),
+    (6, "analytics rollups: attendance bands, leave totals, decisions per faculty", _migration_analytics_rollups),
+    (7, "export job heartbeat", _migration_export_job_heartbeat),
+    (8, "attendance rollup ledger watermark", _migration_rollup_ledger_from),
+    (9, "attendance bands count students only", _migration_student_attendance_buckets),
+]
+
+
+def run_migrations():
+    """Apply pending migrations to the current database. Returns the versions applied."""
+    applied = []
+    with db.engine.begin() as conn:
+        SchemaVersion.__table__.create(conn, checkfirst=True)
+        current = conn.scalar(db.select(SchemaVersion.version))
+        if current is None:
+            # SQLite databases migrated before schema_version existed kept it in PRAGMA user_version
+            current = conn.exec_driver_sql("PRAGMA user_version").scalar() if conn.dialect.name == 'sqlite' else 0
+            conn.execute(db.insert(SchemaVersion).values(version=current))
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        with db.engine.begin() as conn:
+            migrate(conn)
+            conn.execute(db.update(SchemaVersion).values(version=version))
+        logger.info("Applied migration %d: %s", version, description)
+        applied.append(version)
+    return applied
 
 
 # -------------------- Helpers --------------------
+ATTENDANCE_SORTS = ('id', 'percentage', '-percentage', 'name')
+SQL_IN_CHUNK = 900   # ids per IN (...) lookup, below SQLite's bound-parameter limit
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _upsert(model):
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+        return postgresql_insert(model)
+    return sqlite_insert(model)
+
+
+def attendance_percentage(student_id):
+    """A student's current attendance percentage: one primary-key lookup."""
+    return db.session.scalar(
+        db.select(AttendanceRollup.percentage).where(AttendanceRollup.student_id == student_id)) or 0.0
+
+
+def record_attendance_snapshots(records):
+    """
+    Insert Attendance snapshots (dicts with student_id, present_days, total_days,
+    percentage, updated_by, updated_at) and reset each student's rollup to those
+    totals. The snapshot covers every lecture recorded so far, so later
+    corrections to those lectures no longer move the rollup.
+    Commits nothing; the caller owns the transaction.
+    """
+    db.session.execute(db.insert(Attendance), records)
+    latest = {r['student_id']: r for r in records}
+    ledger_from = db.session.scalar(db.select(func.coalesce(func.max(AttendanceEntry.id), 0)))
+    stmt = _upsert(AttendanceRollup)
+    # executemany, one row per execution, so class size is not bounded by SQLite's variable limit
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=[AttendanceRollup.student_id],
+        set_={'present_count': stmt.excluded.present_count, 'total_count': stmt.excluded.total_count,
+              'percentage': stmt.excluded.percentage, 'updated_at': stmt.excluded.updated_at,
+              'ledger_from': stmt.excluded.ledger_from},
+    ), [
+        {'student_id': r['student_id'], 'present_count': r['present_days'], 'total_count': r['total_days'],
+         'percentage': r['percentage'], 'updated_at': r['updated_at'], 'ledger_from': ledger_from}
+        for r in latest.values()
+    ])
+
+
+def record_lecture_attendance(lecture, marks, recorded_by):
+    """
+    Record one lecture in the ledger. `marks` maps student_id -> present (bool).
+    Re-recording a lecture only changes the students whose mark changed. Rollups
+    are adjusted by the deltas; a correction to a lecture that a later snapshot
+    already covers only updates the ledger. A rollup seeded from a legacy
+    snapshot (a percentage but no day counts) keeps that percentage until the
+    next snapshot with counts. Commits nothing; the caller owns the transaction.
+    Returns (added, changed).
+    """
+    previous = {}   # student_id -> (present, counted in the rollup)
+    for chunk in batched(marks, SQL_IN_CHUNK):
+        for student_id, present, entry_id, ledger_from in db.session.execute(
+                db.select(AttendanceEntry.student_id, AttendanceEntry.present, AttendanceEntry.id,
+                          AttendanceRollup.ledger_from)
+                .outerjoin(AttendanceRollup, AttendanceRollup.student_id == AttendanceEntry.student_id)
+                .where(AttendanceEntry.lecture == lecture, AttendanceEntry.student_id.in_(chunk))):
+            previous[student_id] = (present, entry_id > (ledger_from or 0))
+
+    now = datetime.utcnow()
+    new_rows, changed, deltas = [], [], []
+    for student_id, present in marks.items():
+        if student_id not in previous:
+            new_rows.append({'student_id': student_id, 'lecture': lecture, 'present': present,
+                             'recorded_by': recorded_by, 'recorded_at': now})
+            deltas.append({'student_id': student_id, 'present_count': int(present), 'total_count': 1})
+        elif previous[student_id][0] != present:
+            changed.append(student_id)
+            if previous[student_id][1]:
+                deltas.append({'student_id': student_id, 'present_count': 1 if present else -1, 'total_count': 0})
+
+    if new_rows:
+        db.session.execute(db.insert(AttendanceEntry), new_rows)
+    for present in (True, False):
+        flipped = [sid for sid in changed if marks[sid] is present]
+        for chunk in batched(flipped, SQL_IN_CHUNK):
+            db.session.execute(
+                db.update(AttendanceEntry)
+                .where(AttendanceEntry.lecture == lecture, AttendanceEntry.student_id.in_(chunk))
+                .values(present=present, recorded_by=recorded_by, recorded_at=now)
+                .execution_options(synchronize_session=False))
+    if deltas:
+        stmt = _upsert(AttendanceRollup)
+        present_count = AttendanceRollup.present_count + stmt.excluded.present_count
+        total_count = AttendanceRollup.total_count + stmt.excluded.total_count
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=[AttendanceRollup.student_id],
+            set_={
+                'present_count': present_count,
+                'total_count': total_count,
+                'percentage': db.case((total_count > 0, func.round(100.0 * present_count / total_count, 2)),
+                                      else_=0.0),
+                'updated_at': now,
+            },
+            # present/total deltas on top of 0/0 would replace the legacy figure
+            where=db.or_(AttendanceRollup.total_count > 0, AttendanceRollup.percentage == 0),
+        ), [{**d, 'percentage': 100.0 * d['present_count'] if d['total_count'] else 0.0, 'updated_at': now}
+            for d in deltas])
+    return len(new_rows), len(changed)
+
+
+def latest_attendance_query(min_pct=None, max_pct=None, sort='id'):
+    """
+    Every student's current attendance percentage, read from the rollup table.
+    Students without any record get 0.0. Rows are (id, name, email, percentage).
+    """
+    percentage = func.coalesce(AttendanceRollup.percentage, 0.0).label('percentage')
+    query = db.session.query(User.id, User.name, User.email, percentage) \
+        .outerjoin(AttendanceRollup, AttendanceRollup.student_id == User.id) \
+        .filter(User.role == 'student')
+
+    if min_pct is not None:
+        query = query.filter(percentage >= min_pct)
+    if max_pct is not None:
+        query = query.filter(percentage <= max_pct)
+
+    if sort == 'percentage':
+        query = query.order_by(percentage.asc(), User.id)
+    elif sort == '-percentage':
+        query = query.order_by(percentage.desc(), User.id)
+    elif sort == 'name':
+        query = query.order_by(User.name, User.id)
+    else:
+        query = query.order_by(User.id)
+    return query
+
+
+def attendance_filters_from_request(args=None):
+    """Read ?min_pct=&max_pct=&sort= (or the same keys from `args`) for latest_attendance_query."""
+    args = request.args if args is None else args
+    min_pct = args.get('min_pct', type=float)
+    max_pct = args.get('max_pct', type=float)
+    sort = args.get('sort', 'id')
+    if sort not in ATTENDANCE_SORTS:
+        sort = 'id'
+    return {'min_pct': min_pct, 'max_pct': max_pct, 'sort': sort}
+
+
 def create_default_admin():
     admin_email = "admin@college.edu"
     admin_password = "Admin@12345"   # CHANGE IMMEDIATELY after first login
     existing = User.query.filter_by(email=admin_email).first()
     if existing:
         return False
-    hashed = generate_password_hash(admin_password, method='pbkdf2:sha256')
+    hashed = hasher.hash(admin_password)
     admin_user = User(name="Default Admin", email=admin_email, password=hashed, role="admin")
     db.session.add(admin_user)
     db.session.commit()
@@ -88,85 +759,512 @@ def create_default_admin():
     return True
 
 
+LEAVE_STATUSES = ('Pending', 'Approved', 'Rejected')
+LEAVE_ATTENDANCE_THRESHOLD = 80   # students below this attendance % cannot apply for leave
+LEAVE_PAGE_SIZE = 50
+SEARCH_PAGE_SIZE = 20
+
+
+def leave_queue_page(status='Pending', student_id=None, before=None, limit=LEAVE_PAGE_SIZE):
+    """
+    One page of the leave queue, newest first, using keyset pagination on Leave.id.
+    Returns (leaves, next_cursor); pass next_cursor back as `before` for the next page.
+    """
+    query = Leave.query
+    if status:
+        query = query.filter(Leave.status == status)
+    if student_id is not None:
+        query = query.filter(Leave.student_id == student_id)
+    if before is not None:
+        query = query.filter(Leave.id < before)
+    leaves = query.order_by(Leave.id.desc()).limit(limit + 1).all()
+    next_cursor = leaves[limit - 1].id if len(leaves) > limit else None
+    return leaves[:limit], next_cursor
+
+
+def leave_queue_filters_from_request():
+    """Read ?status=&student_id=&before= for leave_queue_page; status defaults to Pending, 'all' disables it."""
+    status = request.args.get('status', 'Pending')
+    return {
+        'status': status if status in LEAVE_STATUSES else None,
+        'student_id': request.args.get('student_id', type=int),
+        'before': request.args.get('before', type=int),
+    }
+
+
+def leave_decision_mail(leave_id, name, email, days, reason, status, decided_by):
+    """Outbox message telling a student their leave was decided."""
+    return {
+        'recipient': email,
+        'subject': f"Your leave request #{leave_id} was {status.lower()}",
+        'body': f"Hello {name},\n\nYour leave request #{leave_id} for {days} day(s) ({reason}) "
+                f"was {status.lower()} by {decided_by}.\n",
+    }
+
+
+def _leave_account(column):
+    """`column` of the account that filed the leave. Leave.name/email are typed into the form, so mail goes here."""
+    return db.select(column).where(User.id == Leave.student_id).scalar_subquery()
+
+
+def decide_leave(leave, status, decided_by):
+    """Set a leave's status and queue the student's notification; the caller commits."""
+    leave.status = status
+    leave.approved_by = decided_by
+    name, email = db.session.execute(db.select(User.name, User.email).where(User.id == leave.student_id)).one()
+    notifications.queue(**leave_decision_mail(leave.id, name, email, leave.days, leave.reason, status, decided_by))
+
+
+# -------------------- Dashboard stats cache --------------------
+# Counters for the admin pages, computed in one grouped query and cached per
+# process. The cache is keyed on the data_version counters of the tables they
+# read, so a write in any worker is picked up within DATA_VERSION_CACHE_TTL;
+# STATS_CACHE_TTL caps the age of an entry regardless.
+STATS_MODELS = (User, Leave, Attendance, AttendanceEntry, AttendanceRollup)
+STATS_TABLES = ('user', 'leave', 'attendance_rollup')
+_stats_cache = {'value': None, 'version': None, 'expires': 0.0}
+
+
+def compute_dashboard_stats():
+    roles = db.select(db.literal('role').label('kind'), User.role.label('key'), func.count().label('n')) \
+        .group_by(User.role)
+    statuses = db.select(db.literal('leave').label('kind'), Leave.status.label('key'), func.count().label('n')) \
+        .group_by(Leave.status)
+    stats = {'total_students': 0, 'total_faculty': 0, 'total_admins': 0, 'total_leaves': 0,
+             'pending_leaves': 0, 'approved_leaves': 0, 'rejected_leaves': 0}
+    for kind, key, n in db.session.execute(db.union_all(roles, statuses)):
+        key = (key or 'pending').lower()
+        if kind == 'role':
+            name = 'total_faculty' if key == 'faculty' else f'total_{key}s'
+            stats[name] = stats.get(name, 0) + n
+        else:
+            stats['total_leaves'] += n
+            stats[f'{key}_leaves'] = stats.get(f'{key}_leaves', 0) + n
+    return stats
+
+
+def versioned_cache(cache, compute):
+    """cache['value'], recomputed when STATS_TABLES changed or the entry is older than STATS_CACHE_TTL."""
+    version = cached_data_version(STATS_TABLES)
+    now = time.monotonic()
+    if cache['value'] is None or cache['version'] != version or now >= cache['expires']:
+        cache.update(value=compute(), version=version, expires=now + current_app.config['STATS_CACHE_TTL'])
+    return cache['value']
+
+
+def dashboard_stats():
+    return versioned_cache(_stats_cache, compute_dashboard_stats)
+
+
+# data_version counters, cached for DATA_VERSION_CACHE_TTL seconds so the JSON
+# API and the caches above can be checked without touching the database. Local
+# commits drop the cache; the TTL bounds how late other workers' writes are noticed.
+_version_cache = {'value': None, 'expires': 0.0}
+
+
+def cached_data_version(tables):
+    now = time.monotonic()
+    if _version_cache['value'] is None or now >= _version_cache['expires']:
+        _version_cache['value'] = dict(db.session.execute(db.select(DataVersion.name, DataVersion.version)).all())
+        _version_cache['expires'] = now + current_app.config['DATA_VERSION_CACHE_TTL']
+    versions = _version_cache['value']
+    return ','.join(f"{t}:{versions.get(t, 0)}" for t in sorted(tables))
+
+
+@event.listens_for(db.session, 'after_flush')
+def _track_stats_writes(sess, flush_context):
+    if any(isinstance(obj, STATS_MODELS) for obj in (*sess.new, *sess.dirty, *sess.deleted)):
+        sess.info['stats_dirty'] = True
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _track_stats_bulk_writes(orm_execute_state):
+    # bulk insert()/update()/delete() statements bypass the flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        if any(mapper.class_ in STATS_MODELS for mapper in orm_execute_state.all_mappers):
+            orm_execute_state.session.info['stats_dirty'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_stats_on_commit(sess):
+    if sess.info.pop('stats_dirty', False):
+        _version_cache['value'] = None
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_stats_writes(sess):
+    sess.info.pop('stats_dirty', None)
+
+
+# -------------------- Analytics --------------------
+# Attendance bands, leave totals and decisions per faculty member are rollup
+# tables kept current by triggers (migration 6), so this reads a few dozen
+# rows however many students, snapshots and leaves there are. Databases other
+# than SQLite have no rollups and aggregate the base tables instead. Either way
+# the rows are cached like dashboard_stats.
+_analytics_cache = {'value': None, 'version': None, 'expires': 0.0}
+
+def _analytics_from_rollups():
+    buckets = dict(db.session.execute(db.select(AttendanceBucket.bucket, AttendanceBucket.students)).all())
+    counters = dict(db.session.execute(db.select(AnalyticsCounter.name, AnalyticsCounter.value)).all())
+    faculty = db.session.execute(db.select(FacultyLeaveStats.approved_by, FacultyLeaveStats.approved,
+                                           FacultyLeaveStats.rejected, FacultyLeaveStats.approved_days)).all()
+    return buckets, counters, faculty
+
+
+def _analytics_from_base_tables():
+    students = User.query.filter(func.lower(User.role) == 'student')
+    band = func.floor(AttendanceRollup.percentage / ATTENDANCE_BUCKET_WIDTH)
+    buckets = {}
+    for b, n in db.session.execute(
+            db.select(band, func.count()).join(User, User.id == AttendanceRollup.student_id)
+            .where(func.lower(User.role) == 'student').group_by(band)):
+        b = min(max(int(b), 0), ATTENDANCE_BUCKETS - 1)
+        buckets[b] = buckets.get(b, 0) + n
+
+    counters = {'students': students.count()}
+    status = func.coalesce(Leave.status, 'Pending')
+    for name, count, days in db.session.execute(
+            db.select(status, func.count(), func.coalesce(func.sum(Leave.days), 0)).group_by(status)):
+        counters[f'leaves:{name}'], counters[f'leave_days:{name}'] = count, days
+
+    approved = Leave.status == 'Approved'
+    faculty = db.session.execute(
+        db.select(Leave.approved_by, func.sum(db.case((approved, 1), else_=0)),
+                  func.sum(db.case((Leave.status == 'Rejected', 1), else_=0)),
+                  func.sum(db.case((approved, Leave.days), else_=0)))
+        .where(Leave.approved_by.isnot(None), Leave.status.in_(('Approved', 'Rejected')))
+        .group_by(Leave.approved_by)).all()
+    return buckets, counters, faculty
+
+
+def analytics_rows():
+    return versioned_cache(_analytics_cache, _analytics_from_rollups if db.engine.dialect.name == 'sqlite'
+                           else _analytics_from_base_tables)
+
+
+def attendance_analytics(thresholds=(LEAVE_ATTENDANCE_THRESHOLD,)):
+    """thresholds must be multiples of ATTENDANCE_BUCKET_WIDTH."""
+    width = ATTENDANCE_BUCKET_WIDTH
+    buckets, counters, faculty_rows = analytics_rows()
+    students = counters.get('students', 0)
+    # students without any attendance yet count as 0%, as everywhere else
+    without_attendance = max(students - sum(buckets.values()), 0)
+
+    leaves = {status: {'count': counters.get(f'leaves:{status}', 0), 'days': counters.get(f'leave_days:{status}', 0)}
+              for status in LEAVE_STATUSES}
+    total_days = sum(v['days'] for v in leaves.values())
+    faculty = [{'name': name, 'approved': approved, 'rejected': rejected,
+                'approval_rate': round(approved / (approved + rejected), 3), 'approved_days': approved_days}
+               for name, approved, rejected, approved_days in sorted(faculty_rows, key=lambda r: (-(r[1] + r[2]), r[0]))
+               if approved + rejected]
+    return {
+        'students': students,
+        'students_without_attendance': without_attendance,
+        'attendance_histogram': [{'from': b * width, 'to': (b + 1) * width, 'students': buckets.get(b, 0)}
+                                 for b in range(ATTENDANCE_BUCKETS)],
+        'below_threshold': [{'threshold': t, 'students': without_attendance
+                             + sum(buckets.get(b, 0) for b in range(t // width))} for t in thresholds],
+        'leaves': leaves,
+        'avg_leave_days_per_student': round(total_days / students, 2) if students else 0.0,
+        'avg_approved_days_per_student': round(leaves['Approved']['days'] / students, 2) if students else 0.0,
+        'faculty': faculty,
+    }
+
+
+def dashboard_queries():
+    """The hot queries behind the dashboards, keyed by a short label (used by explain-queries)."""
+    return {
+        'student counts': User.query.filter_by(role='student'),
+        'leave status list': Leave.query.filter_by(student_id=1).order_by(Leave.id.desc()),
+        'pending leaves': Leave.query.filter_by(status='Pending').order_by(Leave.id.desc()),
+        'faculty leave queue page': Leave.query.filter(Leave.status == 'Pending', Leave.id < 1000)
+            .order_by(Leave.id.desc()).limit(LEAVE_PAGE_SIZE + 1),
+        'student latest attendance': Attendance.query.filter_by(student_id=1)
+            .order_by(Attendance.updated_at.desc(), Attendance.id.desc()).limit(1),
+        'student attendance rollup': AttendanceRollup.query.filter_by(student_id=1),
+        'all latest attendance': latest_attendance_query(),
+    }
+
+
+def prepare_database():
+    """
+    Create missing tables, apply pending migrations and make sure an admin
+    exists. Run once per deploy (flask migrate-db), not in every worker.
+    """
+    db.create_all()
+    applied = run_migrations()
+    if create_default_admin():
+        logger.info("Default admin created (admin@college.edu). Change the password immediately.")
+    return applied
+
+
+@click.command('migrate-db')
+@with_appcontext
+def migrate_db_command():
+    """Create missing tables, apply pending schema migrations and bootstrap the admin account."""
+    applied = prepare_database()
+    print(f"Applied migrations: {applied}" if applied else "Database is up to date.")
+
+
+@click.command('explain-queries')
+@with_appcontext
+def explain_queries_command():
+    """Print SQLite query plans for the dashboard queries."""
+    for label, query in dashboard_queries().items():
+        sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+        print(f"-- {label}")
+        for row in db.session.execute(db.text(f"EXPLAIN QUERY PLAN {sql}")):
+            print(f"   {row[-1]}")
+
+
+# -------------------- Attendance compaction --------------------
+# strftime() buckets for the history that compaction keeps: the newest row per
+# student in each bucket survives, everything else is archived and deleted.
+COMPACTION_GRANULARITIES = {
+    'day': '%Y-%m-%d',
+    'week': '%Y-%W',
+    'month': '%Y-%m',
+    'latest': None,   # keep only each student's latest row
+}
+ARCHIVE_COLUMNS = ['id', 'student_id', 'percentage', 'present_days', 'total_days', 'updated_by', 'updated_at']
+
+
+def _superseded_attendance_ids(first_student, last_student, granularity):
+    bucket = COMPACTION_GRANULARITIES[granularity]
+    if bucket is None:
+        partition = (Attendance.student_id,)
+    elif db.engine.dialect.name == 'sqlite':
+        partition = (Attendance.student_id, func.strftime(bucket, Attendance.updated_at))
+    else:
+        partition = (Attendance.student_id, func.date_trunc(granularity, Attendance.updated_at))
+    ranked = db.select(
+        Attendance.id,
+        func.row_number().over(partition_by=partition,
+                               order_by=(Attendance.updated_at.desc(), Attendance.id.desc())).label('rn')
+    ).where(Attendance.student_id.between(first_student, last_student)).subquery()
+    return db.session.scalars(db.select(ranked.c.id).where(ranked.c.rn > 1).order_by(ranked.c.id)).all()
+
+
+def compact_attendance(granularity='week', batch_students=200, archive_dir=None, pause=0.0):
+    """
+    Archive superseded attendance snapshots to a gzip CSV and delete them.
+    Works through students in batches of `batch_students`, one short
+    transaction each, so writers never wait long for the lock.
+    Returns (rows archived, archive path or None).
+    """
+    archive_dir = archive_dir or os.path.join(EXPORT_FOLDER, 'archive')
+    student_ids = db.session.scalars(db.select(Attendance.student_id).distinct().order_by(Attendance.student_id)).all()
+    db.session.commit()
+
+    archived, path, out, writer = 0, None, None, None
+    try:
+        for i in range(0, len(student_ids), batch_students):
+            batch = student_ids[i:i + batch_students]
+            # each batch reads and then deletes; a read transaction that tries to
+            # write after another connection's commit fails at once on SQLite
+            db.session.connection(execution_options={'write_lock': True})
+            ids = _superseded_attendance_ids(batch[0], batch[-1], granularity)
+            if not ids:
+                db.session.commit()
+                continue
+            if out is None:
+                os.makedirs(archive_dir, exist_ok=True)
+                timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+                path = os.path.join(archive_dir, f"attendance_archive_{timestamp}.csv.gz")
+                out = gzip.open(path, 'wt', newline='', encoding='utf-8')
+                writer = csv.writer(out)
+                writer.writerow(ARCHIVE_COLUMNS)
+            for chunk in batched(ids, SQL_IN_CHUNK):
+                rows = db.session.execute(
+                    db.select(*(getattr(Attendance, c) for c in ARCHIVE_COLUMNS)).where(Attendance.id.in_(chunk)))
+                writer.writerows([_export_value(v) for v in row] for row in rows)
+                db.session.execute(db.delete(Attendance).where(Attendance.id.in_(chunk))
+                                   .execution_options(synchronize_session=False))
+            # the archive must hold the rows before their deletion becomes permanent
+            out.flush()
+            db.session.commit()
+            archived += len(ids)
+            logger.info("Compacted attendance for students %s-%s: %d rows archived", batch[0], batch[-1], len(ids))
+            if pause:
+                time.sleep(pause)
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        if out is not None:
+            out.close()
+    return archived, path
+
+
+def reclaim_space(mode):
+    """
+    'full' runs VACUUM. 'incremental' frees the pages compaction emptied; the
+    first run on a database without auto_vacuum=INCREMENTAL switches it on,
+    which takes one VACUUM.
+    """
+    if db.engine.dialect.name != 'sqlite' or mode == 'none':
+        return
+    raw = db.engine.raw_connection()
+    try:
+        conn = raw.driver_connection
+        if mode == 'full':
+            conn.execute("VACUUM")
+        elif conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            # executescript steps the pragma to the end; execute() frees a single page
+            conn.executescript("PRAGMA incremental_vacuum;")
+        else:
+            logger.info("Switching the database to auto_vacuum=INCREMENTAL (one full VACUUM)")
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        if conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal':
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        raw.close()
+
+
+@click.command('compact-attendance')
+@click.option('--granularity', type=click.Choice(list(COMPACTION_GRANULARITIES)), default='week',
+              help="History to keep per student besides the latest row.")
+@click.option('--batch-students', default=200, show_default=True, help="Students per transaction.")
+@click.option('--archive-dir', default=None, help="Where the gzip CSV goes (default exports/archive).")
+@click.option('--pause', default=0.0, help="Seconds to sleep between batches.")
+@click.option('--vacuum', type=click.Choice(['incremental', 'full', 'none']), default='incremental',
+              help="How to shrink the file afterwards; the first incremental run does one full VACUUM.")
+@with_appcontext
+def compact_attendance_command(granularity, batch_students, archive_dir, pause, vacuum):
+    """Archive and delete superseded attendance snapshots, then reclaim space."""
+    archived, path = compact_attendance(granularity, batch_students, archive_dir, pause)
+    reclaim_space(vacuum)
+    print(f"Archived {archived} attendance rows to {path}." if archived else "Nothing to compact.")
+
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+    """Fingerprint and precompress the stylesheets in static/css (run once per deploy)."""
+    manifest = assets.build()
+    print(f"Built {len(manifest)} assets into {assets.dist}.")
+
+
+@click.command('send-notifications')
+@with_appcontext
+def send_notifications_command():
+    """Send the notification mails that are due (for OUTBOX_DISPATCHER=off, e.g. from cron)."""
+    sent, retrying, failed = notifications.dispatch()
+    print(f"{sent} sent, {retrying} to retry, {failed} failed.")
+
+
 # -------------------- Routes (unchanged logic) --------------------
-@app.route('/')
+auth_bp = Blueprint('auth', __name__)
+student_bp = Blueprint('student', __name__)
+faculty_bp = Blueprint('faculty', __name__)
+admin_bp = Blueprint('admin', __name__)
+exports_bp = Blueprint('exports', __name__)
+api_bp = Blueprint('api', __name__)
+debug_bp = Blueprint('debug', __name__)
+BLUEPRINTS = (auth_bp, student_bp, faculty_bp, admin_bp, exports_bp, api_bp, debug_bp)
+
+
+@auth_bp.route('/')
 def home():
-    return redirect(url_for('login'))
+    return redirect(url_for('auth.login'))
 
 
-@app.route('/register', methods=['GET', 'POST'])
+@auth_bp.route('/register', methods=['GET', 'POST'])
 def register():
     flash("Public registration is disabled. Please contact the admin to create an account.", "info")
-    return redirect(url_for('login'))
+    return redirect(url_for('auth.login'))
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         email = request.form['email'].strip().lower()
         password = request.form['password']
 
-        user = User.query.filter_by(email=email).first()
-        if user and check_password_hash(user.password, password):
+        user = db.session.execute(
+            db.select(User.id, User.name, User.role, User.password).where(User.email == email)).first()
+        db.session.rollback()
+        try:
+            valid = bool(user) and hasher.check(user.password, password)
+        except HasherBusy:
+            flash("The server is busy, please try again in a moment.", "error")
+            return render_template('login.html'), 503
+
+        if valid and hasher.needs_rehash(user.password):
+            try:
+                db.session.execute(db.update(User).where(User.id == user.id).values(password=hasher.hash(password)))
+                db.session.commit()
+            except HasherBusy:
+                pass  # keep the old hash, retried on the next login
+
+        if valid:
             session['user_id'] = user.id
             session['role'] = user.role.lower()
             session['name'] = user.name
             flash(f"Welcome, {user.name}!", "success")
 
             if user.role.lower() == 'student':
-                return redirect(url_for('student_dashboard'))
+                return redirect(url_for('student.student_dashboard'))
             elif user.role.lower() == 'faculty':
-                return redirect(url_for('faculty_dashboard'))
+                return redirect(url_for('faculty.faculty_dashboard'))
             elif user.role.lower() == 'admin':
-                return redirect(url_for('admin_dashboard'))
+                return redirect(url_for('admin.admin_dashboard'))
             else:
-                return redirect(url_for('login'))
+                return redirect(url_for('auth.login'))
         else:
             flash("Invalid email or password!", "error")
-            return redirect(url_for('login'))
+            return redirect(url_for('auth.login'))
 
     return render_template('login.html')
 
 
-@app.route('/forgot-password', methods=['GET', 'POST'])
+@auth_bp.route('/forgot-password', methods=['GET', 'POST'])
 def forgot_password():
     if request.method == 'POST':
         email = request.form['email'].strip().lower()
         new_password = request.form['new_password']
         confirm_password = request.form['confirm_password']
 
-        user = User.query.filter_by(email=email).first()
-        if not user:
+        user_id = db.session.scalar(db.select(User.id).where(User.email == email))
+        db.session.rollback()
+        if not user_id:
             flash("❌ No account found with that email.", "error")
-            return redirect(url_for('forgot_password'))
+            return redirect(url_for('auth.forgot_password'))
 
         if new_password != confirm_password:
             flash("❌ Passwords do not match.", "error")
-            return redirect(url_for('forgot_password'))
+            return redirect(url_for('auth.forgot_password'))
 
-        user.password = generate_password_hash(new_password, method='pbkdf2:sha256')
+        try:
+            password_hash = hasher.hash(new_password)
+        except HasherBusy:
+            flash("The server is busy, please try again in a moment.", "error")
+            return redirect(url_for('auth.forgot_password'))
+        db.session.execute(db.update(User).where(User.id == user_id).values(password=password_hash))
         db.session.commit()
         flash("✅ Password reset successful! Please log in.", "success")
-        return redirect(url_for('login'))
+        return redirect(url_for('auth.login'))
 
     return render_template('reset_password.html')
 
 
-@app.route('/student', methods=['GET', 'POST'])
+@student_bp.route('/student', methods=['GET', 'POST'])
 def student_dashboard():
     if 'role' not in session or session['role'].lower() != 'student':
         flash("You are not authorized to view this page.", "error")
-        return redirect(url_for('login'))
+        return redirect(url_for('auth.login'))
 
     user_id = session['user_id']
-    attendance_record = Attendance.query.filter_by(student_id=user_id) \
-        .order_by(Attendance.updated_at.desc(), Attendance.id.desc()).first()
-    attendance_percentage = attendance_record.percentage if attendance_record else 0.0
+    current_percentage = attendance_percentage(user_id)
 
     if request.method == 'POST':
-        if attendance_percentage < 80:
-            flash("⚠ Attendance below 80%. You cannot apply for leave.", "error")
-            return redirect(url_for('student_dashboard'))
+        # the form, and any document with it, is only read from the client below
+        db.session.rollback()
+        if current_percentage < LEAVE_ATTENDANCE_THRESHOLD:
+            flash(f"⚠ Attendance below {LEAVE_ATTENDANCE_THRESHOLD}%. You cannot apply for leave.", "error")
+            return redirect(url_for('student.student_dashboard'))
 
         full_name = request.form['full_name']
         email = request.form['email']
@@ -174,14 +1272,18 @@ def student_dashboard():
             days = int(request.form['days'])
         except ValueError:
             flash("Invalid number of days.", "error")
-            return redirect(url_for('student_dashboard'))
+            return redirect(url_for('student.student_dashboard'))
         reason = request.form['reason']
         file = request.files.get('document')
         filename = None
 
         if file and file.filename:
-            filename = secure_filename(file.filename)
-            file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+            try:
+                filename = save_upload(file, current_app.config['UPLOAD_FOLDER'], current_app.config['UPLOAD_MAX_BYTES'],
+                                       current_app.config['UPLOAD_ALLOWED_EXTENSIONS'])
+            except UploadRejected as e:
+                flash(f"❌ {e}", "error")
+                return redirect(url_for('student.student_dashboard'))
 
         leave = Leave(
             student_id=user_id,
@@ -194,27 +1296,48 @@ def student_dashboard():
         db.session.add(leave)
         db.session.commit()
         flash("✅ Leave application submitted successfully!", "success")
-        return redirect(url_for('student_dashboard'))
+        return redirect(url_for('student.student_dashboard'))
 
-    return render_template('student_dashboard.html', name=session['name'], attendance=round(attendance_percentage, 2))
+    return render_template('student_dashboard.html', name=session['name'], attendance=round(current_percentage, 2))
 
 
-@app.route('/leave-status')
+@student_bp.route('/documents/<path:name>')
+def leave_document(name):
+    """
+    Serve an uploaded leave document with ETag/Range support. Content-addressed
+    names never change content, so they are cached for a year as immutable.
+    """
+    if 'role' not in session:
+        flash("Please log in to view documents.", "error")
+        return redirect(url_for('auth.login'))
+
+    name = secure_filename(name)
+    if is_content_addressed(name):
+        response = send_from_directory(current_app.config['UPLOAD_FOLDER'], name, conditional=True,
+                                       etag=name.split('.')[0], max_age=DOCUMENT_CACHE_SECONDS)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+    # documents uploaded before content addressing may still be replaced
+    return send_from_directory(current_app.config['UPLOAD_FOLDER'], name, conditional=True, max_age=3600)
+
+
+@student_bp.route('/leave-status')
 def leave_status():
     if 'role' not in session or session['role'].lower() != 'student':
         flash("You are not authorized to view this page.", "error")
-        return redirect(url_for('login'))
+        return redirect(url_for('auth.login'))
 
     user_id = session['user_id']
     leaves = Leave.query.filter_by(student_id=user_id).order_by(Leave.id.desc()).all()
     return render_template('leave_status.html', name=session['name'], leaves=leaves)
 
 
-@app.route('/faculty', methods=['GET', 'POST'])
+@faculty_bp.route('/faculty', methods=['GET', 'POST'])
 def faculty_dashboard():
     if 'role' not in session or session['role'].lower() != 'faculty':
         flash("You are not authorized to view this page.", "error")
-        return redirect(url_for('login'))
+        return redirect(url_for('auth.login'))
 
     if request.method == 'POST':
         if 'leave_action' in request.form:
@@ -225,24 +1348,24 @@ def faculty_dashboard():
             if leave:
                 if session.get('name') == leave.name:
                     flash("You cannot approve your own leave.", "error")
-                    return redirect(url_for('faculty_dashboard'))
+                    return redirect(url_for('faculty.faculty_dashboard'))
 
-                leave.status = "Approved" if action == "approve" else "Rejected"
-                leave.approved_by = session['name']
+                decide_leave(leave, "Approved" if action == "approve" else "Rejected", session['name'])
                 db.session.commit()
                 flash(f"Leave ID {leave.id} marked as {leave.status}.", "success")
-            return redirect(url_for('faculty_dashboard'))
+            return redirect(url_for('faculty.faculty_dashboard', **request.args))
 
-    leaves = Leave.query.all()
-    students = User.query.filter_by(role='student').all()
-    return render_template('faculty_dashboard.html', faculty_name=session['name'], leaves=leaves, students=students)
+    filters = leave_queue_filters_from_request()
+    leaves, next_cursor = leave_queue_page(**filters)
+    return render_template('faculty_dashboard.html', faculty_name=session['name'], leaves=leaves,
+                           filters=filters, next_cursor=next_cursor, statuses=LEAVE_STATUSES)
 
 
-@app.route('/update_attendance', methods=['GET', 'POST'])
+@faculty_bp.route('/update_attendance', methods=['GET', 'POST'])
 def update_attendance():
     if 'role' not in session or session['role'].lower() != 'faculty':
         flash("You are not authorized to perform this action.", "error")
-        return redirect(url_for('login'))
+        return redirect(url_for('auth.login'))
 
     students = User.query.filter_by(role='student').order_by(User.id).all()
 
@@ -255,85 +1378,415 @@ def update_attendance():
 
             if total_days <= 0:
                 flash("❌ Total days must be greater than zero.", "error")
-                return redirect(url_for('update_attendance'))
+                return redirect(url_for('faculty.update_attendance'))
 
             if present_days < 0 or present_days > total_days:
                 flash("❌ Present days must be between 0 and total days.", "error")
-                return redirect(url_for('update_attendance'))
+                return redirect(url_for('faculty.update_attendance'))
 
             percentage = round((present_days / total_days) * 100.0, 2)
             logger.info("Computed percentage for student %d: %s (present %d of %d)", student_id, percentage, present_days, total_days)
 
-            record = Attendance(student_id=student_id, percentage=percentage, updated_by=session['name'], updated_at=datetime.utcnow())
-            db.session.add(record)
+            record_attendance_snapshots([{'student_id': student_id, 'percentage': percentage,
+                                          'present_days': present_days, 'total_days': total_days,
+                                          'updated_by': session['name'], 'updated_at': datetime.utcnow()}])
             db.session.commit()
 
-            logger.info("Saved Attendance id=%s for student_id=%s percentage=%s", record.id, student_id, record.percentage)
+            logger.info("Saved attendance for student_id=%s percentage=%s", student_id, percentage)
             flash(f"✅ Attendance updated for Student ID {student_id}: {percentage:.2f}%", "success")
-            return redirect(url_for('update_attendance'))
+            return redirect(url_for('faculty.update_attendance'))
 
         except Exception as e:
             logger.exception("Error updating attendance")
             flash(f"⚠ Error updating attendance: {str(e)}", "error")
-            return redirect(url_for('update_attendance'))
+            return redirect(url_for('faculty.update_attendance'))
 
     return render_template('update_attendance.html', students=students)
 
 
+BULK_ATTENDANCE_FIELDS = ('student_id', 'total_days', 'present_days')
+
+
+def parse_bulk_attendance():
+    """Rows from a JSON batch (list or {"rows": [...]}) or an uploaded CSV with the BULK_ATTENDANCE_FIELDS header."""
+    if request.is_json:
+        payload = request.get_json(silent=True)
+        if isinstance(payload, dict):
+            payload = payload.get('rows')
+        if not isinstance(payload, list):
+            raise ValueError("Expected a JSON list of rows or {\"rows\": [...]}.")
+        return payload
+
+    file = request.files.get('file')
+    if not file or not file.filename:
+        raise ValueError("No CSV file uploaded.")
+    text = io.TextIOWrapper(file.stream, encoding='utf-8-sig')
+    reader = csv.DictReader(text)
+    missing = [f for f in BULK_ATTENDANCE_FIELDS if f not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"CSV is missing columns: {', '.join(missing)}")
+    return list(reader)
+
+
+def validate_bulk_attendance(rows):
+    """
+    Validate every row against the same rules as the single-student form.
+    Returns (records ready for insert, [{'row': n, 'error': ...}]); rows are numbered from 1.
+    """
+    parsed, errors = [], []
+    for n, row in enumerate(rows, start=1):
+        try:
+            student_id, total_days, present_days = (int(row[f]) for f in BULK_ATTENDANCE_FIELDS)
+        except (KeyError, TypeError, ValueError):
+            errors.append({'row': n, 'error': "student_id, total_days and present_days must be integers."})
+            continue
+        if total_days <= 0:
+            errors.append({'row': n, 'error': "Total days must be greater than zero."})
+        elif present_days < 0 or present_days > total_days:
+            errors.append({'row': n, 'error': "Present days must be between 0 and total days."})
+        else:
+            parsed.append((n, student_id, present_days, total_days))
+
+    ids = {p[1] for p in parsed}
+    known = set()
+    for chunk in batched(ids, SQL_IN_CHUNK):
+        known.update(db.session.scalars(db.select(User.id).where(User.role == 'student', User.id.in_(chunk))))
+
+    records = []
+    now = datetime.utcnow()
+    for n, student_id, present_days, total_days in parsed:
+        if student_id not in known:
+            errors.append({'row': n, 'error': f"No student with ID {student_id}."})
+        else:
+            records.append({'student_id': student_id, 'present_days': present_days, 'total_days': total_days,
+                            'percentage': round((present_days / total_days) * 100.0, 2),
+                            'updated_by': session['name'], 'updated_at': now})
+    errors.sort(key=lambda e: e['row'])
+    return records, errors
+
+
+@faculty_bp.route('/update_attendance/bulk', methods=['POST'])
+def update_attendance_bulk():
+    """
+    Bulk attendance for a whole class from a CSV upload or JSON batch.
+    The batch is all-or-nothing: any invalid row rejects it and the per-row report says why.
+    """
+    if 'role' not in session or session['role'].lower() != 'faculty':
+        if request.is_json:
+            return jsonify({'error': "Unauthorized"}), 403
+        flash("You are not authorized to perform this action.", "error")
+        return redirect(url_for('auth.login'))
+
+    try:
+        rows = parse_bulk_attendance()
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        if request.is_json:
+            return jsonify({'inserted': 0, 'errors': [{'row': None, 'error': str(e)}]}), 400
+        flash(f"❌ {e}", "error")
+        return redirect(url_for('faculty.update_attendance'))
+
+    records, errors = validate_bulk_attendance(rows)
+    inserted = 0
+    if not errors and records:
+        record_attendance_snapshots(records)
+        db.session.commit()
+        inserted = len(records)
+    logger.info("Bulk attendance by %s: %d rows, %d inserted, %d errors",
+                session['name'], len(rows), inserted, len(errors))
+
+    if request.is_json:
+        return jsonify({'received': len(rows), 'inserted': inserted, 'errors': errors}), (400 if errors else 200)
+
+    if errors:
+        flash(f"❌ {len(errors)} invalid row(s); nothing was saved.", "error")
+    else:
+        flash(f"✅ Attendance updated for {inserted} student(s).", "success")
+    students = User.query.filter_by(role='student').order_by(User.id).all()
+    return render_template('update_attendance.html', students=students, bulk_errors=errors)
+
+
+LEAVE_BATCH_ACTIONS = {'approve': 'Approved', 'reject': 'Rejected'}
+LEAVE_BATCH_FILTERS = ('student_id', 'min_pct', 'max_pct')
+
+
+def _is_json_int(value):
+    # bool is an int subclass, but true/false are not ids
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def leave_batch_condition(payload):
+    """
+    WHERE clause for a batch decision: explicit `leave_ids`, or a `filter` with any of
+    student_id, min_pct and max_pct (latest attendance). Only pending leaves are ever matched.
+    """
+    condition = Leave.status == 'Pending'
+    if 'leave_ids' in payload:
+        ids = payload['leave_ids']
+        if not isinstance(ids, list) or not ids or not all(_is_json_int(i) for i in ids):
+            raise ValueError("leave_ids must be a non-empty list of integers.")
+        return condition & Leave.id.in_(ids)
+
+    filters = payload.get('filter')
+    if not isinstance(filters, dict):
+        raise ValueError("Provide either leave_ids or filter.")
+    # an empty filter would decide every pending leave in the database
+    if all(filters.get(key) is None for key in LEAVE_BATCH_FILTERS):
+        raise ValueError(f"filter needs at least one of {', '.join(LEAVE_BATCH_FILTERS)}.")
+    if filters.get('student_id') is not None:
+        if not _is_json_int(filters['student_id']):
+            raise ValueError("filter.student_id must be an integer.")
+        condition &= Leave.student_id == filters['student_id']
+    min_pct, max_pct = filters.get('min_pct'), filters.get('max_pct')
+    if min_pct is not None or max_pct is not None:
+        students = latest_attendance_query(
+            min_pct=None if min_pct is None else float(min_pct),
+            max_pct=None if max_pct is None else float(max_pct),
+        ).subquery()
+        condition &= Leave.student_id.in_(db.select(students.c.id))
+    return condition
+
+
+@faculty_bp.route('/leaves/batch', methods=['POST'])
+def leaves_batch():
+    """
+    Approve or reject many pending leaves in one UPDATE, e.g.
+    {"action": "approve", "filter": {"min_pct": 90}} or {"action": "reject", "leave_ids": [4, 5]}.
+    Leaves in the decider's own name are skipped, as in the single-leave form.
+    """
+    if 'role' not in session or session['role'].lower() not in ('faculty', 'admin'):
+        return jsonify({'error': "Unauthorized"}), 403
+
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'error': "Expected a JSON object."}), 400
+    status = LEAVE_BATCH_ACTIONS.get(payload.get('action'))
+    if not status:
+        return jsonify({'error': "action must be 'approve' or 'reject'."}), 400
+    try:
+        condition = leave_batch_condition(payload)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    decided_by = session['name']
+    own = db.session.scalar(db.select(func.count(Leave.id)).where(condition, Leave.name == decided_by))
+    decided = db.session.execute(
+        db.update(Leave).where(condition, Leave.name != decided_by)
+        .values(status=status, approved_by=decided_by)
+        .returning(Leave.id, _leave_account(User.name), _leave_account(User.email), Leave.days, Leave.reason)
+        .execution_options(synchronize_session=False)
+    ).all()
+    notifications.queue_many([leave_decision_mail(*row, status, decided_by) for row in decided])
+    db.session.commit()
+    logger.info("Batch %s by %s: %d updated, %d skipped (own)", status, decided_by, len(decided), own)
+    return jsonify({'status': status, 'updated': len(decided), 'skipped_own': own})
+
+
+@faculty_bp.route('/attendance/lecture', methods=['POST'])
+def record_lecture():
+    """
+    Record one lecture in the attendance ledger:
+    {"lecture": "2025-11-20 DS1", "present": [2, 3], "absent": [4]}.
+    Posting the same lecture again corrects individual marks.
+    """
+    if 'role' not in session or session['role'].lower() != 'faculty':
+        return jsonify({'error': "Unauthorized"}), 403
+
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'error': "Expected a JSON object."}), 400
+    lecture = str(payload.get('lecture') or '').strip()
+    if not lecture or len(lecture) > 100:
+        return jsonify({'error': "lecture is required (at most 100 characters)."}), 400
+    try:
+        marks = {int(i): True for i in payload.get('present') or []}
+        marks.update({int(i): False for i in payload.get('absent') or []})
+    except (TypeError, ValueError):
+        return jsonify({'error': "present and absent must be lists of student IDs."}), 400
+    if not marks:
+        return jsonify({'error': "No students marked."}), 400
+
+    known = set()
+    for chunk in batched(marks, SQL_IN_CHUNK):
+        known.update(db.session.scalars(db.select(User.id).where(User.role == 'student', User.id.in_(chunk))))
+    unknown = sorted(set(marks) - known)
+    if unknown:
+        return jsonify({'error': "Unknown student IDs.", 'student_ids': unknown}), 400
+
+    added, changed = record_lecture_attendance(lecture, marks, session['name'])
+    db.session.commit()
+    return jsonify({'lecture': lecture, 'added': added, 'changed': changed})
+
+
 # ---------------- ADMIN ROUTES ----------------
-@app.route('/admin')
+@admin_bp.route('/admin')
 def admin_dashboard():
     if 'role' not in session or session['role'].lower() != 'admin':
         flash("You are not authorized to access admin panel.", "error")
-        return redirect(url_for('login'))
-
-    total_students = User.query.filter_by(role='student').count()
-    total_faculty = User.query.filter_by(role='faculty').count()
-    total_leaves = Leave.query.count()
+        return redirect(url_for('auth.login'))
 
-    return render_template('admin_dashboard.html', name=session['name'],
-                           total_students=total_students, total_faculty=total_faculty, total_leaves=total_leaves)
+    return render_template('admin_dashboard.html', name=session['name'], analytics=attendance_analytics(),
+                           **dashboard_stats())
 
 
-@app.route('/admin/leaves', methods=['GET', 'POST'])
+@admin_bp.route('/admin/leaves', methods=['GET', 'POST'])
 def admin_leaves():
     if 'role' not in session or session['role'].lower() != 'admin':
         flash("Unauthorized access.", "error")
-        return redirect(url_for('login'))
+        return redirect(url_for('auth.login'))
 
     if request.method == 'POST':
         leave_id = int(request.form['leave_id'])
         action = request.form['action']
         leave = Leave.query.get(leave_id)
         if leave:
-            leave.status = "Approved" if action == "approve" else "Rejected"
-            leave.approved_by = session['name']
+            decide_leave(leave, "Approved" if action == "approve" else "Rejected", session['name'])
             db.session.commit()
             flash(f"Leave ID {leave.id} has been {leave.status}.", "success")
-        return redirect(url_for('admin_leaves'))
+        return redirect(url_for('admin.admin_leaves'))
 
     leaves = Leave.query.order_by(Leave.id.desc()).all()
 
     students = []
-    for s in User.query.filter_by(role='student').order_by(User.id).all():
-        rec = Attendance.query.filter_by(student_id=s.id).order_by(Attendance.updated_at.desc(), Attendance.id.desc()).first()
-        perc = rec.percentage if rec else 0.0
+    for s in latest_attendance_query(**attendance_filters_from_request()):
         students.append({
             'id': s.id,
             'name': s.name,
             'email': s.email,
             'lectures_attended': '—',
-            'percentage': round(perc, 2)
+            'percentage': round(s.percentage, 2)
         })
 
     return render_template('admin_leaves.html', leaves=leaves, students=students)
 
 
-@app.route('/admin/users', methods=['GET', 'POST'])
+# ---------------- Bulk user import ----------------
+# Same layout as the users_export_*.csv files: id,name,email,role,password_hash.
+# The id column is ignored. A plain-text `password` column may be given instead of
+# password_hash; those passwords are hashed across the hashing pool.
+USER_ROLES = ('student', 'faculty', 'admin')
+USER_IMPORT_CHUNK = 500
+
+
+def validate_user_import(rows):
+    """Returns (valid users as dicts, [{'row': n, 'error': ...}]); rows are numbered from 1."""
+    users, errors, seen = [], [], {}
+    for n, row in enumerate(rows, start=1):
+        name = (row.get('name') or '').strip()
+        email = (row.get('email') or '').strip().lower()
+        role = (row.get('role') or '').strip().lower()
+        password = row.get('password') or ''
+        password_hash = (row.get('password_hash') or '').strip()
+        if not name or not email or not role:
+            errors.append({'row': n, 'error': "name, email and role are required."})
+        elif '@' not in email or len(email) > 150 or len(name) > 150:
+            errors.append({'row': n, 'error': f"Invalid email or name: {email}"})
+        elif role not in USER_ROLES:
+            errors.append({'row': n, 'error': f"Unknown role '{role}'."})
+        elif not password and not password_hash:
+            errors.append({'row': n, 'error': "password or password_hash is required."})
+        elif password_hash and password_hash.count('$') != 2:
+            errors.append({'row': n, 'error': "password_hash is not a werkzeug hash."})
+        elif email in seen:
+            errors.append({'row': n, 'error': f"Duplicate of row {seen[email]} ({email})."})
+        else:
+            seen[email] = n
+            users.append({'row': n, 'name': name, 'email': email, 'role': role,
+                          'password': password, 'password_hash': password_hash})
+
+    existing = set()
+    for chunk in batched(seen, SQL_IN_CHUNK):
+        existing.update(db.session.scalars(db.select(User.email).where(User.email.in_(chunk))))
+    if existing:
+        errors.extend({'row': u['row'], 'error': f"Email already exists: {u['email']}"}
+                      for u in users if u['email'] in existing)
+        users = [u for u in users if u['email'] not in existing]
+    errors.sort(key=lambda e: e['row'])
+    return users, errors
+
+
+def import_users(rows, dry_run=False):
+    """
+    Validate and, unless dry_run or any row is invalid, create the users in
+    chunked transactions. Returns a report dict.
+    """
+    users, errors = validate_user_import(rows)
+    report = {'received': len(rows), 'valid': len(users), 'created': 0, 'dry_run': dry_run, 'errors': errors}
+    # hashing takes a while; don't hold the read transaction open across it
+    db.session.rollback()
+    if dry_run or errors or not users:
+        return report
+
+    plain = [u for u in users if not u['password_hash']]
+    for user, hashed in zip(plain, hasher.hash_many([u['password'] for u in plain])):
+        user['password_hash'] = hashed
+
+    for i in range(0, len(users), USER_IMPORT_CHUNK):
+        chunk = users[i:i + USER_IMPORT_CHUNK]
+        db.session.execute(db.insert(User), [
+            {'name': u['name'], 'email': u['email'], 'role': u['role'], 'password': u['password_hash']}
+            for u in chunk])
+        db.session.commit()
+        report['created'] += len(chunk)
+    logger.info("Imported %d users", report['created'])
+    return report
+
+
+def read_user_csv(stream):
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig'))
+    missing = [c for c in ('name', 'email', 'role') if c not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"CSV is missing columns: {', '.join(missing)}")
+    return list(reader)
+
+
+@admin_bp.route('/admin/users/import', methods=['POST'])
+def admin_import_users():
+    """Import users from an uploaded CSV; tick dry_run to only get the validation report."""
+    if 'role' not in session or session['role'].lower() != 'admin':
+        flash("Unauthorized access.", "error")
+        return redirect(url_for('auth.login'))
+
+    file = request.files.get('file')
+    dry_run = bool(request.form.get('dry_run'))
+    try:
+        if not file or not file.filename:
+            raise ValueError("No CSV file uploaded.")
+        report = import_users(read_user_csv(file.stream), dry_run=dry_run)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        flash(f"❌ {e}", "error")
+        return redirect(url_for('admin.admin_users'))
+    except HasherBusy:
+        flash("The server is busy, please try again in a moment.", "error")
+        return redirect(url_for('admin.admin_users'))
+
+    if report['errors']:
+        flash(f"❌ {len(report['errors'])} invalid row(s); no users were created.", "error")
+    elif dry_run:
+        flash(f"✅ Dry run: all {report['valid']} row(s) are valid.", "success")
+    else:
+        flash(f"✅ Created {report['created']} user(s).", "success")
+    users = db.session.query(User.id, User.name, User.email, User.role).order_by(User.id.desc()).all()
+    return render_template('admin_users.html', users=users, import_report=report, **dashboard_stats())
+
+
+@click.command('import-users')
+@click.argument('csv_file', type=click.File('rb'))
+@click.option('--dry-run', is_flag=True, help="Only validate and print the report.")
+@with_appcontext
+def import_users_command(csv_file, dry_run):
+    """Create users from a CSV in the users_export layout."""
+    report = import_users(read_user_csv(csv_file), dry_run=dry_run)
+    for error in report['errors']:
+        print(f"row {error['row']}: {error['error']}")
+    print(f"{report['received']} rows, {report['valid']} valid, {report['created']} created"
+          + (" (dry run)" if dry_run else ""))
+
+
+@admin_bp.route('/admin/users', methods=['GET', 'POST'])
 def admin_users():
     if 'role' not in session or session['role'].lower() != 'admin':
         flash("Unauthorized access.", "error")
-        return redirect(url_for('login'))
+        return redirect(url_for('auth.login'))
 
     if request.method == 'POST':
         action = request.form.get('action')
@@ -342,224 +1795,575 @@ def admin_users():
             email = request.form['email'].strip().lower()
             password = request.form['password']
             role = request.form['role'].strip().lower()
-            if User.query.filter_by(email=email).first():
+            exists = db.session.scalar(db.select(User.id).where(User.email == email))
+            db.session.rollback()
+            if exists:
                 flash("Email already exists!", "error")
             else:
-                new_user = User(name=name, email=email,
-                                password=generate_password_hash(password, method='pbkdf2:sha256'),
-                                role=role)
+                try:
+                    new_user = User(name=name, email=email, password=hasher.hash(password), role=role)
+                except HasherBusy:
+                    flash("The server is busy, please try again in a moment.", "error")
+                    return redirect(url_for('admin.admin_users'))
                 db.session.add(new_user)
                 db.session.commit()
                 flash("User added successfully.", "success")
-            return redirect(url_for('admin_users'))
+            return redirect(url_for('admin.admin_users'))
 
         elif action == 'delete':
             user_id = int(request.form.get('user_id'))
-            user = User.query.get(user_id)
-            if user:
-                if user.id == session.get('user_id'):
-                    flash("You cannot delete your own admin account.", "error")
-                else:
-                    try:
-                        Leave.query.filter_by(student_id=user.id).delete()
-                        Attendance.query.filter_by(student_id=user.id).delete()
-                        db.session.delete(user)
-                        db.session.commit()
+            if user_id == session.get('user_id'):
+                flash("You cannot delete your own admin account.", "error")
+            else:
+                # deletes only, so the transaction starts out as a write
+                try:
+                    Leave.query.filter_by(student_id=user_id).delete()
+                    Attendance.query.filter_by(student_id=user_id).delete()
+                    AttendanceEntry.query.filter_by(student_id=user_id).delete()
+                    AttendanceRollup.query.filter_by(student_id=user_id).delete()
+                    deleted = User.query.filter_by(id=user_id).delete()
+                    db.session.commit()
+                    if deleted:
                         flash("User deleted successfully.", "success")
-                    except Exception as e:
-                        db.session.rollback()
-                        flash(f"Error deleting user: {str(e)}", "error")
-            return redirect(url_for('admin_users'))
+                except Exception as e:
+                    db.session.rollback()
+                    flash(f"Error deleting user: {str(e)}", "error")
+            return redirect(url_for('admin.admin_users'))
 
-    users = User.query.order_by(User.id.desc()).all()
-    total_students = User.query.filter_by(role='student').count()
-    total_faculty = User.query.filter_by(role='faculty').count()
-    total_leaves = Leave.query.count()
-    return render_template('admin_users.html', users=users,
-                           total_students=total_students, total_faculty=total_faculty, total_leaves=total_leaves)
+    users = db.session.query(User.id, User.name, User.email, User.role).order_by(User.id.desc()).all()
+    return render_template('admin_users.html', users=users, **dashboard_stats())
 
 
-@app.route('/admin/attendance')
+@admin_bp.route('/admin/attendance')
 def admin_attendance():
     if 'role' not in session or session['role'].lower() != 'admin':
         flash("Unauthorized access.", "error")
-        return redirect(url_for('login'))
+        return redirect(url_for('auth.login'))
 
     students = []
-    for s in User.query.filter_by(role='student').order_by(User.id).all():
-        rec = Attendance.query.filter_by(student_id=s.id).order_by(Attendance.updated_at.desc(), Attendance.id.desc()).first()
-        perc = rec.percentage if rec else 0.0
-        students.append({'id': s.id, 'name': s.name, 'email': s.email, 'percentage': round(perc, 2)})
+    for s in latest_attendance_query(**attendance_filters_from_request()):
+        students.append({'id': s.id, 'name': s.name, 'email': s.email, 'percentage': round(s.percentage, 2)})
     return render_template('admin_attendance.html', students=students)
 
 
+@admin_bp.route('/metrics')
+def metrics_endpoint():
+    token = current_app.config.get('METRICS_TOKEN')
+    bearer = request.headers.get('Authorization', '')
+    is_admin = 'role' in session and session['role'].lower() == 'admin'
+    if not is_admin and not (token and secrets.compare_digest(bearer, f'Bearer {token}')):
+        return Response("Unauthorized\n", status=403, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 # ---------------- New export endpoints (PDF) ----------------
-@app.route('/admin/download-attendance-all')
+# Columns are (title, x, max_chars) as in pdf_export.Column; pdf_export itself
+# is imported by the routes and jobs that render a PDF.
+EXPORT_BATCH_SIZE = 500
+
+ATTENDANCE_ALL_COLUMNS = [
+    ("ID", 40, None),
+    ("Name", 60, 32),
+    ("Email", 260, 36),
+    ("Attendance %", 460, None),
+]
+USERS_COLUMNS = [
+    ("ID", 40, None),
+    ("Name", 60, 36),
+    ("Email", 320, 44),
+]
+ATTENDANCE_REPORT_COLUMNS = [
+    ("ID", 40, None),
+    ("Name", 80, 28),
+    ("Email", 260, 30),
+    ("Attendance %", 460, None),
+]
+
+
+def pdf_response(chunks, filename):
+    """Stream PDF chunks to the client as they are rendered."""
+    return Response(stream_with_context(chunks), mimetype='application/pdf',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+def attendance_rows(query):
+    for s in query.yield_per(EXPORT_BATCH_SIZE):
+        yield s.id, s.name, s.email, f"{s.percentage:.2f}%"
+
+
+@exports_bp.route('/admin/download-attendance-all')
 def download_attendance_all():
     # admin-only
     if 'role' not in session or session['role'].lower() != 'admin':
         flash("Unauthorized access.", "error")
-        return redirect(url_for('login'))
+        return redirect(url_for('auth.login'))
 
-    students = User.query.filter_by(role='student').order_by(User.id).all()
+    students = latest_attendance_query(**attendance_filters_from_request())
     timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
     filename = f"attendance_export_{timestamp}.pdf"
 
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-    margin = 40
-    y = height - margin
-
-    # Title
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(margin, y, "Student Attendance Export")
-    y -= 25
-
-    # Header row
-    p.setFont("Helvetica-Bold", 10)
-    p.drawString(margin, y, "ID")
-    p.drawString(60, y, "Name")
-    p.drawString(260, y, "Email")
-    p.drawString(460, y, "Attendance %")
-    y -= 18
-    p.setFont("Helvetica", 9)
-
-    for s in students:
-        rec = Attendance.query.filter_by(student_id=s.id).order_by(Attendance.updated_at.desc(), Attendance.id.desc()).first()
-        perc = rec.percentage if rec else 0.0
-
-        # write row (truncate where needed)
-        p.drawString(margin, y, str(s.id))
-        p.drawString(60, y, (s.name[:32] + '...') if len(s.name) > 32 else s.name)
-        p.drawString(260, y, (s.email[:36] + '...') if len(s.email) > 36 else s.email)
-        p.drawString(460, y, f"{perc:.2f}%")
-        y -= 16
-
-        # new page if near bottom
-        if y < 60:
-            p.showPage()
-            y = height - margin
-            p.setFont("Helvetica-Bold", 10)
-            p.drawString(margin, y, "ID")
-            p.drawString(60, y, "Name")
-            p.drawString(260, y, "Email")
-            p.drawString(460, y, "Attendance %")
-            y -= 18
-            p.setFont("Helvetica", 9)
-
-    p.save()
-    buffer.seek(0)
-    return send_file(buffer, as_attachment=True, download_name=filename, mimetype='application/pdf')
-
-
-@app.route('/admin/export-users')
+    from pdf_export import stream_table_pdf
+    chunks = stream_table_pdf("Student Attendance Export", ATTENDANCE_ALL_COLUMNS, attendance_rows(students))
+    return pdf_response(chunks, filename)
+
+
+@exports_bp.route('/admin/export-users')
 def export_users():
     # admin-only
     if 'role' not in session or session['role'].lower() != 'admin':
         flash("Unauthorized access.", "error")
-        return redirect(url_for('login'))
+        return redirect(url_for('auth.login'))
 
-    users = User.query.order_by(User.id).all()
+    # ID, Name, Email only
+    users = db.session.query(User.id, User.name, User.email).order_by(User.id).yield_per(EXPORT_BATCH_SIZE)
     timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
     filename = f"users_export_{timestamp}.pdf"
 
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-    margin = 40
-    y = height - margin
-
-    # Title
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(margin, y, "Users Export")
-    y -= 25
-
-    # Header row (ID, Name, Email only)
-    p.setFont("Helvetica-Bold", 10)
-    p.drawString(margin, y, "ID")
-    p.drawString(60, y, "Name")
-    p.drawString(320, y, "Email")
-    y -= 18
-    p.setFont("Helvetica", 9)
-
-    for u in users:
-        # truncate long fields to keep layout
-        pid = str(u.id)
-        name = (u.name[:36] + '...') if len(u.name) > 36 else u.name
-        email = (u.email[:44] + '...') if len(u.email) > 44 else u.email
-
-        p.drawString(margin, y, pid)
-        p.drawString(60, y, name)
-        p.drawString(320, y, email)
-        y -= 16
-
-        if y < 60:
-            p.showPage()
-            y = height - margin
-            p.setFont("Helvetica-Bold", 10)
-            p.drawString(margin, y, "ID")
-            p.drawString(60, y, "Name")
-            p.drawString(320, y, "Email")
-            y -= 18
-            p.setFont("Helvetica", 9)
-
-    p.save()
-    buffer.seek(0)
-    return send_file(buffer, as_attachment=True, download_name=filename, mimetype='application/pdf')
-
-
-@app.route('/admin/download-attendance')
+    from pdf_export import stream_table_pdf
+    chunks = stream_table_pdf("Users Export", USERS_COLUMNS, users)
+    return pdf_response(chunks, filename)
+
+
+@exports_bp.route('/admin/download-attendance')
 def download_attendance():
     # legacy PDF route kept unchanged
     if 'role' not in session or session['role'].lower() != 'admin':
         flash("Unauthorized access.", "error")
-        return redirect(url_for('login'))
-
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-    y = height - 40
-
-    p.setFont("Helvetica-Bold", 16)
-    p.drawString(160, y, "Student Attendance Report")
-    y -= 30
-    p.setFont("Helvetica-Bold", 11)
-    p.drawString(40, y, "ID")
-    p.drawString(80, y, "Name")
-    p.drawString(260, y, "Email")
-    p.drawString(460, y, "Attendance %")
-    y -= 18
-    p.setFont("Helvetica", 10)
+        return redirect(url_for('auth.login'))
 
-    students = User.query.filter_by(role='student').order_by(User.id).all()
-    for s in students:
-        rec = Attendance.query.filter_by(student_id=s.id).order_by(Attendance.updated_at.desc(), Attendance.id.desc()).first()
-        perc = rec.percentage if rec else 0.0
-        p.drawString(40, y, str(s.id))
-        p.drawString(80, y, (s.name[:28] + '...') if len(s.name) > 28 else s.name)
-        p.drawString(260, y, (s.email[:30] + '...') if len(s.email) > 30 else s.email)
-        p.drawString(460, y, f"{perc:.2f}%")
-        y -= 16
-        if y < 60:
-            p.showPage()
-            y = height - 40
-            p.setFont("Helvetica", 10)
-
-    p.save()
-    buffer.seek(0)
-    return send_file(buffer, as_attachment=True, download_name="attendance_report.pdf", mimetype='application/pdf')
-
-
-@app.route('/logout')
+    students = latest_attendance_query(**attendance_filters_from_request())
+    from pdf_export import stream_table_pdf
+    chunks = stream_table_pdf("Student Attendance Report", ATTENDANCE_REPORT_COLUMNS, attendance_rows(students),
+                              title_x=160, title_size=16, header_size=11, body_size=10, title_gap=30,
+                              repeat_header=False)
+    return pdf_response(chunks, "attendance_report.pdf")
+
+
+# ---------------- Streaming CSV / NDJSON exports ----------------
+def _users_export_query(args):
+    # password hashes are never exported
+    return db.session.query(User.id, User.name, User.email, User.role).order_by(User.id)
+
+
+def _attendance_export_query(args):
+    return latest_attendance_query(**attendance_filters_from_request(args))
+
+
+def _attendance_history_export_query(args):
+    return db.session.query(Attendance.id, Attendance.student_id, User.name, User.email,
+                            Attendance.percentage, Attendance.updated_by, Attendance.updated_at) \
+        .join(User, User.id == Attendance.student_id) \
+        .order_by(Attendance.id)
+
+
+def _leaves_export_query(args):
+    query = db.session.query(Leave.id, Leave.student_id, Leave.name, Leave.email, Leave.days,
+                             Leave.reason, Leave.document, Leave.status, Leave.approved_by)
+    status = args.get('status')
+    if status:
+        query = query.filter(Leave.status == status)
+    return query.order_by(Leave.id)
+
+
+# dataset -> (file prefix, column names, query factory)
+EXPORT_DATASETS = {
+    'users': ('users_export', ['id', 'name', 'email', 'role'], _users_export_query),
+    'attendance': ('attendance_export', ['id', 'name', 'email', 'attendance_percentage'],
+                   _attendance_export_query),
+    'attendance-history': ('attendance_history_export',
+                           ['id', 'student_id', 'name', 'email', 'percentage', 'updated_by', 'updated_at'],
+                           _attendance_history_export_query),
+    'leaves': ('leaves_export',
+               ['id', 'student_id', 'name', 'email', 'days', 'reason', 'document', 'status', 'approved_by'],
+               _leaves_export_query),
+}
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+
+def _export_value(value):
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, float):
+        return round(value, 2)
+    return value
+
+
+def stream_csv(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in batches:
+        for row in batch:
+            writer.writerow([_export_value(v) for v in row])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_ndjson(columns, batches):
+    for batch in batches:
+        yield ''.join(json.dumps(dict(zip(columns, map(_export_value, row)))) + '\n' for row in batch)
+
+
+@exports_bp.route('/admin/export/<dataset>.<fmt>')
+def export_dataset(dataset, fmt):
+    # admin-only
+    if 'role' not in session or session['role'].lower() != 'admin':
+        flash("Unauthorized access.", "error")
+        return redirect(url_for('auth.login'))
+
+    if dataset not in EXPORT_DATASETS or fmt not in EXPORT_FORMATS:
+        flash("Unknown export.", "error")
+        return redirect(url_for('admin.admin_leaves'))
+
+    prefix, columns, make_query = EXPORT_DATASETS[dataset]
+    rows = db.session.execute(make_query(request.args).statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    writer = stream_csv if fmt == 'csv' else stream_ndjson
+    chunks = writer(columns, rows.partitions())
+
+    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    return Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={prefix}_{timestamp}.{fmt}'})
+
+
+# ---------------- Background export jobs ----------------
+# Exports requested through /admin/export-jobs run on a small thread pool and
+# are written to EXPORT_FOLDER. A finished file is reused for an identical
+# request as long as the data_version counters of the tables it reads are
+# unchanged. Job state lives in the export_job table so any worker can report it.
+# Running jobs write their progress and a heartbeat there every
+# EXPORT_HEARTBEAT_SECONDS; a job whose worker died (restart, crash) stops
+# beating and is marked failed after EXPORT_JOB_STALE_SECONDS, so an identical
+# request starts a fresh job instead of waiting on it forever.
+EXPORT_JOB_TABLES = {
+    'users': ('user',),
+    'attendance': ('user', 'attendance_rollup'),
+    'attendance-history': ('user', 'attendance'),
+    'leaves': ('leave',),
+}
+# dataset -> (title, columns, row formatter) for PDF jobs
+EXPORT_JOB_PDFS = {
+    'users': ("Users Export", USERS_COLUMNS, lambda rows: ((r[0], r[1], r[2]) for r in rows)),
+    'attendance': ("Student Attendance Export", ATTENDANCE_ALL_COLUMNS, attendance_rows),
+}
+EXPORT_HEARTBEAT_SECONDS = 10
+_export_executor = {'pool': None, 'pid': None}
+_export_progress = {}   # job id -> rows written, for jobs running in this process
+
+
+def data_version(tables):
+    versions = dict(db.session.execute(
+        db.select(DataVersion.name, DataVersion.version).where(DataVersion.name.in_(tables))).all())
+    return ','.join(f"{t}:{versions.get(t, 0)}" for t in sorted(tables))
+
+
+def _export_pool():
+    if _export_executor['pool'] is None or _export_executor['pid'] != os.getpid():
+        _export_executor['pool'] = ThreadPoolExecutor(max_workers=current_app.config['EXPORT_JOB_WORKERS'],
+                                                      thread_name_prefix='export')
+        _export_executor['pid'] = os.getpid()
+    return _export_executor['pool']
+
+
+def _count_rows(query):
+    return db.session.scalar(db.select(func.count()).select_from(query.order_by(None).subquery()))
+
+
+def _export_heartbeat(job_id, progress):
+    """
+    Record progress on a connection of its own: the job's session is holding its
+    read cursor open. With SQLite this needs WAL (the production profile); in
+    rollback-journal mode the open read blocks the commit, and the job only
+    reports progress to its own process.
+    """
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(db.update(ExportJob).where(ExportJob.id == job_id)
+                         .values(progress=progress, heartbeat_at=datetime.utcnow()))
+    except OperationalError as e:
+        logger.warning("Could not record progress of export job %s: %s", job_id, e)
+
+
+def _tracked_rows(job, rows):
+    """Yield rows, noting progress every EXPORT_BATCH_SIZE rows and a heartbeat every EXPORT_HEARTBEAT_SECONDS."""
+    beat = time.monotonic()
+    for n, row in enumerate(rows, start=1):
+        yield row
+        if n % EXPORT_BATCH_SIZE == 0:
+            _export_progress[job.id] = n
+            if time.monotonic() - beat >= EXPORT_HEARTBEAT_SECONDS:
+                _export_heartbeat(job.id, n)
+                beat = time.monotonic()
+
+
+def expire_stale_export_jobs():
+    """Mark queued or running jobs whose worker stopped sending heartbeats as failed."""
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['EXPORT_JOB_STALE_SECONDS'])
+    stale = ExportJob.status.in_(('queued', 'running')) \
+        & (func.coalesce(ExportJob.heartbeat_at, ExportJob.created_at) < cutoff)
+    # a plain read first, so status polls never take the write lock
+    if db.session.scalar(db.select(ExportJob.id).where(stale).limit(1)) is None:
+        return
+    db.session.commit()
+    expired = db.session.execute(
+        db.update(ExportJob).where(stale)
+        .values(status='failed', error="The export worker stopped responding.", finished_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    logger.warning("Marked %d stale export job(s) as failed", expired)
+
+
+def _update_export_job(job_id, **values):
+    # in a fresh transaction: SQLite fails a read transaction that tries to write
+    # while another connection holds the write lock, instead of waiting for it
+    db.session.rollback()
+    db.session.execute(db.update(ExportJob).where(ExportJob.id == job_id).values(**values))
+    db.session.commit()
+
+
+def run_export_job(app, job_id):
+    with app.app_context():
+        tmp_path = None
+        try:
+            _update_export_job(job_id, status='running', heartbeat_at=datetime.utcnow())
+            job = db.session.get(ExportJob, job_id)
+            args = MultiDict(json.loads(job.params))
+            prefix, columns, make_query = EXPORT_DATASETS[job.dataset]
+            query = make_query(args)
+            total = _count_rows(query)
+            _update_export_job(job_id, total=total)
+
+            rows = _tracked_rows(job, query.yield_per(EXPORT_BATCH_SIZE))
+            if job.fmt == 'pdf':
+                from pdf_export import stream_table_pdf
+                title, pdf_columns, format_rows = EXPORT_JOB_PDFS[job.dataset]
+                chunks, mode = stream_table_pdf(title, pdf_columns, format_rows(rows)), 'wb'
+            else:
+                writer = stream_csv if job.fmt == 'csv' else stream_ndjson
+                chunks, mode = writer(columns, batched(rows, EXPORT_BATCH_SIZE)), 'w'
+
+            timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+            filename = f"{prefix}_{timestamp}_job{job.id}.{job.fmt}"
+            tmp_path = os.path.join(EXPORT_FOLDER, f".{filename}.part")
+            with open(tmp_path, mode, **({} if mode == 'wb' else {'newline': '', 'encoding': 'utf-8'})) as out:
+                for chunk in chunks:
+                    out.write(chunk)
+            os.replace(tmp_path, os.path.join(EXPORT_FOLDER, filename))
+            _update_export_job(job_id, filename=filename, progress=total, status='done',
+                               finished_at=datetime.utcnow())
+        except Exception as e:
+            logger.exception("Export job %s failed", job_id)
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            _update_export_job(job_id, status='failed', error=str(e), finished_at=datetime.utcnow())
+        finally:
+            _export_progress.pop(job_id, None)
+
+
+def export_job_json(job):
+    data = {
+        'id': job.id, 'dataset': job.dataset, 'format': job.fmt, 'status': job.status,
+        'progress': _export_progress.get(job.id, job.progress), 'total': job.total, 'error': job.error,
+        'created_at': job.created_at.strftime("%Y-%m-%d %H:%M:%S") if job.created_at else None,
+        'finished_at': job.finished_at.strftime("%Y-%m-%d %H:%M:%S") if job.finished_at else None,
+    }
+    if job.status == 'done':
+        data['download_url'] = url_for('exports.export_job_download', job_id=job.id)
+    return data
+
+
+@exports_bp.route('/admin/export-jobs', methods=['POST'])
+def create_export_job():
+    """
+    Queue an export: {"dataset": "attendance", "format": "csv", "params": {"min_pct": 80}}.
+    Returns the job right away; an unchanged, already exported dataset returns the finished job.
+    """
+    if 'role' not in session or session['role'].lower() != 'admin':
+        return jsonify({'error': "Unauthorized"}), 403
+
+    payload = request.get_json(silent=True) or request.form
+    if not isinstance(payload, dict):
+        return jsonify({'error': "Expected a JSON object."}), 400
+    dataset, fmt = payload.get('dataset'), payload.get('format', 'csv')
+    if dataset not in EXPORT_DATASETS or fmt not in (*EXPORT_FORMATS, 'pdf') \
+            or (fmt == 'pdf' and dataset not in EXPORT_JOB_PDFS):
+        return jsonify({'error': "Unknown dataset or format."}), 400
+    params = payload.get('params') or {}
+    if not isinstance(params, dict):
+        return jsonify({'error': "params must be an object."}), 400
+    params = json.dumps({k: str(v) for k, v in params.items()}, sort_keys=True)
+    version = data_version(EXPORT_JOB_TABLES[dataset])
+
+    expire_stale_export_jobs()
+    existing = ExportJob.query.filter(
+        ExportJob.dataset == dataset, ExportJob.fmt == fmt, ExportJob.params == params,
+        ExportJob.data_version == version, ExportJob.status.in_(('queued', 'running', 'done'))
+    ).order_by(ExportJob.id.desc()).first()
+    if existing and (existing.status != 'done'
+                     or os.path.exists(os.path.join(EXPORT_FOLDER, existing.filename))):
+        return jsonify(export_job_json(existing)), 200
+
+    job = ExportJob(dataset=dataset, fmt=fmt, params=params, data_version=version, created_by=session['name'])
+    db.session.add(job)
+    db.session.commit()
+    _export_pool().submit(run_export_job, current_app._get_current_object(), job.id)
+    return jsonify(export_job_json(job)), 202
+
+
+@exports_bp.route('/admin/export-jobs/<int:job_id>')
+def export_job_status(job_id):
+    if 'role' not in session or session['role'].lower() != 'admin':
+        return jsonify({'error': "Unauthorized"}), 403
+    expire_stale_export_jobs()
+    job = db.session.get(ExportJob, job_id)
+    if not job:
+        return jsonify({'error': "No such job."}), 404
+    return jsonify(export_job_json(job))
+
+
+@exports_bp.route('/admin/export-jobs/<int:job_id>/download')
+def export_job_download(job_id):
+    if 'role' not in session or session['role'].lower() != 'admin':
+        flash("Unauthorized access.", "error")
+        return redirect(url_for('auth.login'))
+    job = db.session.get(ExportJob, job_id)
+    if not job or job.status != 'done':
+        return jsonify({'error': "Export is not ready."}), 404
+    return send_from_directory(os.path.abspath(EXPORT_FOLDER), job.filename, as_attachment=True)
+
+
+# ---------------- Read-only JSON API ----------------
+# Every response carries an ETag derived from the data_version counters of the
+# tables it reads, the caller and the query string. A matching If-None-Match
+# is answered with 304 before any query runs or any JSON is built.
+def conditional_json(tables, build):
+    version = cached_data_version(tables)
+    key = f"{request.full_path}|{session.get('user_id')}|{session.get('role')}|{version}"
+    etag = hashlib.sha1(key.encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True   # always revalidate, which is cheap
+    return response
+
+
+def _leave_json(leave):
+    return {'id': leave.id, 'student_id': leave.student_id, 'name': leave.name, 'email': leave.email,
+            'days': leave.days, 'reason': leave.reason, 'document': leave.document,
+            'status': leave.status, 'approved_by': leave.approved_by}
+
+
+@api_bp.route('/api/leaves')
+def api_leaves():
+    """
+    Students get their own leaves. Faculty and admins get the leave queue with
+    the same ?status=&student_id=&before= keyset paging as the faculty dashboard.
+    """
+    role = session.get('role', '').lower()
+    if role == 'student':
+        def build():
+            leaves = Leave.query.filter_by(student_id=session['user_id']).order_by(Leave.id.desc()).all()
+            return {'leaves': [_leave_json(leave) for leave in leaves]}
+    elif role in ('faculty', 'admin'):
+        def build():
+            leaves, next_cursor = leave_queue_page(**leave_queue_filters_from_request())
+            return {'leaves': [_leave_json(leave) for leave in leaves], 'next_cursor': next_cursor}
+    else:
+        return jsonify({'error': "Unauthorized"}), 403
+    return conditional_json(('leave',), build)
+
+
+@api_bp.route('/api/attendance')
+def api_attendance():
+    """A student's own attendance, or for faculty/admins every student's (?min_pct=&max_pct=&sort=)."""
+    role = session.get('role', '').lower()
+    if role == 'student':
+        def build():
+            rollup = db.session.get(AttendanceRollup, session['user_id'])
+            return {'student_id': session['user_id'],
+                    'percentage': round(rollup.percentage, 2) if rollup else 0.0,
+                    'present': rollup.present_count if rollup else 0,
+                    'total': rollup.total_count if rollup else 0}
+    elif role in ('faculty', 'admin'):
+        def build():
+            rows = latest_attendance_query(**attendance_filters_from_request())
+            return {'students': [{'id': r.id, 'name': r.name, 'email': r.email,
+                                  'percentage': round(r.percentage, 2)} for r in rows]}
+    else:
+        return jsonify({'error': "Unauthorized"}), 403
+    return conditional_json(('user', 'attendance_rollup'), build)
+
+
+@api_bp.route('/api/analytics')
+def api_analytics():
+    """Attendance histogram, students below ?threshold= (repeatable), leave totals and approval rates."""
+    if 'role' not in session or session['role'].lower() != 'admin':
+        return jsonify({'error': "Unauthorized"}), 403
+    thresholds = request.args.getlist('threshold', type=int) or [LEAVE_ATTENDANCE_THRESHOLD]
+    if any(t % ATTENDANCE_BUCKET_WIDTH or not 0 <= t <= 100 for t in thresholds):
+        return jsonify({'error': f"threshold must be a multiple of {ATTENDANCE_BUCKET_WIDTH} from 0 to 100."}), 400
+    return conditional_json(('user', 'leave', 'attendance_rollup'), lambda: attendance_analytics(thresholds))
+
+
+@api_bp.route('/api/search')
+def api_search():
+    """
+    Ranked full-text search: ?q=fever&scope=leaves|users&page=1.
+    Every word is matched as a prefix and all words must match.
+    """
+    if 'role' not in session or session['role'].lower() not in ('faculty', 'admin'):
+        return jsonify({'error': "Unauthorized"}), 403
+
+    scope = request.args.get('scope', 'leaves')
+    if scope not in ('leaves', 'users'):
+        return jsonify({'error': "scope must be 'leaves' or 'users'."}), 400
+    page = max(request.args.get('page', 1, type=int), 1)
+    terms = re.findall(r'\w+', request.args.get('q', ''))[:10]
+    if not terms:
+        return jsonify({'results': [], 'page': page})
+    match = ' '.join(f'"{t}"*' for t in terms)
+    params = {'q': match, 'limit': SEARCH_PAGE_SIZE + 1, 'offset': (page - 1) * SEARCH_PAGE_SIZE}
+
+    if db.engine.dialect.name != 'sqlite':
+        # no FTS5 index outside SQLite: every word must appear in one of the indexed columns, newest first
+        model = Leave if scope == 'leaves' else User
+        fields = (Leave.id, Leave.student_id, Leave.name, Leave.email, Leave.days, Leave.reason, Leave.status,
+                  Leave.approved_by) if scope == 'leaves' else (User.id, User.name, User.email, User.role)
+        columns = [getattr(model, c) for c in FTS_TABLES[model.__tablename__]]
+        sql = db.select(*fields).where(*(db.or_(*(c.ilike(f'%{t}%') for c in columns)) for t in terms)) \
+            .order_by(model.id.desc()).limit(params['limit']).offset(params['offset'])
+        params = {}
+    elif scope == 'leaves':
+        sql = """SELECT l.id, l.student_id, l.name, l.email, l.days, l.reason, l.status, l.approved_by
+                 FROM leave_fts JOIN leave l ON l.id = leave_fts.rowid
+                 WHERE leave_fts MATCH :q ORDER BY bm25(leave_fts, 2.0, 2.0, 1.0)
+                 LIMIT :limit OFFSET :offset"""
+        sql = db.text(sql)
+    else:
+        sql = """SELECT u.id, u.name, u.email, u.role
+                 FROM user_fts JOIN "user" u ON u.id = user_fts.rowid
+                 WHERE user_fts MATCH :q ORDER BY bm25(user_fts)
+                 LIMIT :limit OFFSET :offset"""
+        sql = db.text(sql)
+    rows = [dict(r._mapping) for r in db.session.execute(sql, params)]
+    return jsonify({'results': rows[:SEARCH_PAGE_SIZE], 'page': page,
+                    'next_page': page + 1 if len(rows) > SEARCH_PAGE_SIZE else None})
+
+
+@auth_bp.route('/logout')
 def logout():
     session.clear()
     flash("You have been logged out successfully.", "success")
-    return redirect(url_for('login'))
+    return redirect(url_for('auth.login'))
 
 
 # ----------------- DEBUG ROUTES -----------------
-@app.route('/debug/attendance')
+@debug_bp.route('/debug/attendance')
 def debug_attendance():
     """
     Debug page to inspect latest attendance records.
@@ -583,11 +2387,63 @@ def debug_attendance():
     return html
 
 
+# -------- Application factory --------
+CLI_COMMANDS = (migrate_db_command, explain_queries_command, compact_attendance_command, import_users_command,
+                send_notifications_command, build_assets_command)
+
+
+def create_app(config=None):
+    """
+    Build the Flask app. `config` overrides the defaults from default_config().
+    Workers only build the app; the schema and assets are prepared once beforehand:
+
+        flask --app app migrate-db
+        flask --app app build-assets
+        gunicorn 'app:create_app()'
+    """
+    logging.basicConfig(level=logging.INFO)
+    app = Flask(__name__)
+    app.config.from_mapping(default_config())
+    app.config.from_mapping(config or {})
+    # hard cap on the whole request body, a little above the per-file limit
+    app.config.setdefault('MAX_CONTENT_LENGTH', app.config['UPLOAD_MAX_BYTES'] + 64 * 1024)
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(EXPORT_FOLDER, exist_ok=True)
+
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    is_sqlite = uri.startswith('sqlite')
+    production = app.config['DATABASE_PROFILE'] == 'production'
+    if production and uri not in ('sqlite://', 'sqlite:///:memory:'):
+        options = {
+            'pool_size': app.config['DB_POOL_SIZE'],
+            'max_overflow': app.config['DB_MAX_OVERFLOW'],
+            'pool_timeout': 30,
+        }
+        if not is_sqlite:
+            options.update(pool_pre_ping=True, pool_recycle=1800)
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', options)
+
+    db.init_app(app)
+    hasher.init_app(app)
+    metrics.init_app(app)
+    notifications.init_app(app)
+    assets.init_app(app)
+    with app.app_context():
+        if is_sqlite and production:
+            event.listen(db.engine, 'connect', partial(_sqlite_on_connect, app.config['SQLITE_PRAGMAS']))
+            event.listen(db.engine, 'begin', _sqlite_on_begin)
+        metrics.instrument_engine(db.engine)
+
+    for blueprint in BLUEPRINTS:
+        app.register_blueprint(blueprint)
+    for command in CLI_COMMANDS:
+        app.cli.add_command(command)
+    return app
+
+
 # -------- Run App --------
 if __name__ == '__main__':
+    app = create_app()
     with app.app_context():
-        db.create_all()
-        created = create_default_admin()
-        if created:
-            logger.info("Default admin created (admin@college.edu). Change the password immediately.")
+        prepare_database()
     app.run(debug=True)
@@ -0,0 +1,170 @@
+"""
+Fingerprinted, precompressed static assets and compressed HTML responses.
+
+Stylesheets live in static/css/. `flask build-assets` (also run on first use
+when the build is missing or older than its sources) copies each one to
+static/dist/ under a content-hashed name, e.g. css/login.3f2a9c1d0b7e.css,
+next to .gz and, when the optional `brotli` package is installed, .br
+versions. Templates link them with {{ asset_url('css/login.css') }}. The
+name changes whenever the content does, so /assets/ serves them with a one
+year immutable Cache-Control and the precompressed variant the client
+accepts.
+
+HTML responses are gzipped on the fly when the client accepts it, so after
+the first visit a page view only transfers its own markup and data.
+
+Config keys (all optional):
+    ASSETS_SOURCE        directory holding css/, defaults to the app's static folder
+    ASSETS_DIST          build output directory, defaults to static/dist
+    COMPRESS_MIMETYPES   response types gzipped on the fly, defaults to ('text/html',)
+    COMPRESS_MIN_BYTES   smaller responses are sent as they are, defaults to 500
+    COMPRESS_LEVEL       gzip level, defaults to 6
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from flask import Blueprint, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:   # optional: without it only gzip variants are built
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+ASSET_CACHE_SECONDS = 365 * 24 * 3600
+ASSET_DIRS = ('css',)
+MANIFEST = 'manifest.json'
+# preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+MIMETYPES = {'.css': 'text/css', '.js': 'text/javascript'}
+
+
+def _write(path, data):
+    # built files are content-addressed, so a concurrent build writes the same bytes
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def build_assets(source, dist):
+    """Fingerprint and precompress every asset under source/<ASSET_DIRS>. Returns the manifest."""
+    manifest = {}
+    for directory in ASSET_DIRS:
+        src_dir = os.path.join(source, directory)
+        if not os.path.isdir(src_dir):
+            continue
+        os.makedirs(os.path.join(dist, directory), exist_ok=True)
+        for name in sorted(os.listdir(src_dir)):
+            stem, ext = os.path.splitext(name)
+            if ext not in MIMETYPES:
+                continue
+            with open(os.path.join(src_dir, name), 'rb') as f:
+                data = f.read()
+            built = f"{directory}/{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+            target = os.path.join(dist, built)
+            if not os.path.exists(target):
+                _write(target, data)
+                _write(target + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    _write(target + '.br', brotli.compress(data, quality=11))
+            manifest[f"{directory}/{name}"] = built
+    _write(os.path.join(dist, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+class Assets:
+    def __init__(self, app=None):
+        self.source = None
+        self.dist = None
+        self.compress_mimetypes = ('text/html',)
+        self.compress_min_bytes = 500
+        self.compress_level = 6
+        self._manifest = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.source = app.config.get('ASSETS_SOURCE', app.static_folder)
+        self.dist = app.config.get('ASSETS_DIST', os.path.join(app.static_folder, 'dist'))
+        self.compress_mimetypes = tuple(app.config.get('COMPRESS_MIMETYPES', ('text/html',)))
+        self.compress_min_bytes = app.config.get('COMPRESS_MIN_BYTES', 500)
+        self.compress_level = app.config.get('COMPRESS_LEVEL', 6)
+        self._manifest = None
+
+        blueprint = Blueprint('assets', __name__)
+        blueprint.add_url_rule('/assets/<path:filename>', 'asset', self.serve)
+        app.register_blueprint(blueprint)
+        app.add_template_global(self.url, 'asset_url')
+        app.after_request(self.compress_response)
+        app.extensions['assets'] = self
+
+    # ---- build ----
+    def _stale(self, manifest_path):
+        built_at = os.path.getmtime(manifest_path)
+        for directory in ASSET_DIRS:
+            src_dir = os.path.join(self.source, directory)
+            if os.path.isdir(src_dir) and any(
+                    os.path.getmtime(os.path.join(src_dir, n)) > built_at for n in os.listdir(src_dir)):
+                return True
+        return False
+
+    def manifest(self):
+        if self._manifest is None:
+            with self._lock:
+                if self._manifest is None:
+                    path = os.path.join(self.dist, MANIFEST)
+                    if not os.path.exists(path) or self._stale(path):
+                        self._manifest = self.build()
+                    else:
+                        with open(path) as f:
+                            self._manifest = json.load(f)
+        return self._manifest
+
+    def build(self):
+        manifest = build_assets(self.source, self.dist)
+        logger.info("Built %d assets into %s", len(manifest), self.dist)
+        self._manifest = manifest
+        return manifest
+
+    # ---- serving ----
+    def url(self, name):
+        return f"/assets/{self.manifest()[name]}"
+
+    def serve(self, filename):
+        accepted = request.accept_encodings
+        ext = os.path.splitext(filename)[1]
+        for encoding, suffix in ENCODINGS:
+            if accepted[encoding] and os.path.exists(os.path.join(self.dist, filename + suffix)):
+                response = send_from_directory(self.dist, filename + suffix, conditional=True,
+                                               mimetype=MIMETYPES.get(ext), max_age=ASSET_CACHE_SECONDS)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(self.dist, filename, conditional=True,
+                                           mimetype=MIMETYPES.get(ext), max_age=ASSET_CACHE_SECONDS)
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    def compress_response(self, response):
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in self.compress_mimetypes):
+            return response
+        response.vary.add('Accept-Encoding')
+        if not request.accept_encodings['gzip']:
+            return response
+        data = response.get_data()
+        if len(data) < self.compress_min_bytes:
+            return response
+        response.set_data(gzip.compress(data, compresslevel=self.compress_level))
+        response.headers['Content-Encoding'] = 'gzip'
+        return response
@@ -0,0 +1,115 @@
+"""
+SQLite concurrency: N writer and M reader processes hammer a scratch copy of
+the schema through the Flask test client for a fixed time, then report
+throughput and how many requests failed (e.g. "database is locked").
+
+    python benchmarks/db_concurrency_bench.py --writers 4 --readers 4 --seconds 10
+    python benchmarks/db_concurrency_bench.py --profile default   # compare with stock SQLite settings
+
+Writers POST one-row attendance batches and decide a pending leave; readers
+GET the faculty leave queue.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUDENTS = 200
+
+
+def _load_app(db_path, profile):
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['DATABASE_PROFILE'] = profile
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    import app as application
+    return application, application.create_app({'TESTING': True, 'OUTBOX_DISPATCHER': 'off'})
+
+
+def _client(flask_app, role, name, user_id):
+    client = flask_app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'], sess['role'], sess['name'] = user_id, role, name
+    return client
+
+
+def setup(db_path, profile):
+    A, flask_app = _load_app(db_path, profile)
+    db = A.db
+    with flask_app.app_context():
+        db.create_all()
+        A.run_migrations()
+        db.session.add(A.User(name='Bench Faculty', email='faculty@bench', password='-', role='faculty'))
+        for i in range(STUDENTS):
+            student = A.User(name=f'Student {i}', email=f'student{i}@bench', password='-', role='student')
+            db.session.add(student)
+            db.session.flush()
+            db.session.add(A.Leave(student_id=student.id, name=student.name, email=student.email,
+                                   days=1, reason='bench'))
+        db.session.commit()
+
+
+def worker(kind, db_path, profile, seconds, results):
+    _, flask_app = _load_app(db_path, profile)
+    client = _client(flask_app, 'faculty', 'Bench Faculty', 1)
+    ok = failed = 0
+    n = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        n += 1
+        try:
+            if kind == 'writer':
+                student_id = 2 + n % STUDENTS
+                r = client.post('/update_attendance/bulk',
+                                json=[{'student_id': student_id, 'total_days': 10, 'present_days': n % 11}])
+                if r.status_code == 200 and n % 2 == 0:
+                    r = client.post('/leaves/batch', json={'action': 'approve', 'filter': {'student_id': student_id}})
+            else:
+                r = client.get('/faculty?status=all')
+            if r.status_code == 200:
+                ok += 1
+            else:
+                failed += 1
+        except Exception:
+            failed += 1
+    results.put((kind, ok, failed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--profile', default='production', choices=['production', 'default'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        ctx = multiprocessing.get_context('spawn')
+        p = ctx.Process(target=setup, args=(db_path, args.profile))
+        p.start()
+        p.join()
+
+        results = ctx.Queue()
+        procs = [ctx.Process(target=worker, args=(kind, db_path, args.profile, args.seconds, results))
+                 for kind in ['writer'] * args.writers + ['reader'] * args.readers]
+        for proc in procs:
+            proc.start()
+        totals = {'writer': [0, 0], 'reader': [0, 0]}
+        for _ in procs:
+            kind, ok, failed = results.get()
+            totals[kind][0] += ok
+            totals[kind][1] += failed
+        for proc in procs:
+            proc.join()
+
+    print(f"profile={args.profile} writers={args.writers} readers={args.readers} seconds={args.seconds}")
+    for kind, (ok, failed) in totals.items():
+        print(f"{kind + 's':>8}: {ok / args.seconds:8.1f} req/s ok, {failed} failed")
+
+
+if __name__ == '__main__':
+    main()
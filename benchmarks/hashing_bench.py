@@ -0,0 +1,50 @@
+"""
+Login hashing throughput: how many password checks per second the hashing
+pool sustains, in total and per core.
+
+    python benchmarks/hashing_bench.py [--logins 64] [--method pbkdf2:sha256:1000000]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hashing import PasswordHasher, DEFAULT_METHOD  # noqa: E402
+
+
+def run(workers, logins, method):
+    hasher = PasswordHasher()
+    hasher.method = method
+    hasher.workers = workers
+    stored = hasher.hash('correct horse')
+    hasher.check(stored, 'warm-up')   # start the pool outside the timed section
+
+    # one request thread per login, as a threaded gunicorn worker would do
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=hasher.max_in_flight) as threads:
+        results = list(threads.map(lambda _: hasher.check(stored, 'correct horse'), range(logins)))
+    elapsed = time.perf_counter() - start
+    hasher.shutdown()
+    assert all(results)
+    return logins / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=64)
+    parser.add_argument('--method', default=DEFAULT_METHOD)
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    print(f"method={args.method} cores={cores} logins={args.logins}")
+    print(f"{'workers':>8} {'logins/s':>10} {'per core':>10}")
+    for workers in sorted({1, max(cores // 2, 1), cores}):
+        rate = run(workers, args.logins, args.method)
+        print(f"{workers:>8} {rate:>10.2f} {rate / workers:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
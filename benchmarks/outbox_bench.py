@@ -0,0 +1,175 @@
+"""
+Leave-decision notifications against a local stand-in SMTP server.
+
+Approves N pending leaves through /leaves/batch, then drains the outbox with
+the dispatcher and reports how long the approval request took, how long
+delivery took and how many SMTP connections it needed. --reject-every makes
+the server refuse every Kth recipient once (451), to exercise retries.
+
+    python benchmarks/outbox_bench.py --leaves 500
+    python benchmarks/outbox_bench.py --leaves 200 --reject-every 7
+    python benchmarks/outbox_bench.py --serve 1025     # only run the SMTP stand-in, printing each mail
+
+With --serve, point the app at it: MAIL_SERVER=localhost MAIL_PORT=1025 MAIL_USE_TLS=0.
+"""
+import argparse
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Just enough SMTP to accept mail from smtplib; counts connections and messages."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, reject_every=0, verbose=False):
+        super().__init__(address, _SMTPHandler)
+        self.reject_every = reject_every
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.recipients_seen = 0
+        self.messages = []
+        self.rejected = set()
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply('220 localhost stand-in SMTP')
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip()
+            verb = command[:4].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif verb == 'MAIL':
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                address = command.split(':', 1)[1].strip()
+                with server.lock:
+                    server.recipients_seen += 1
+                    reject = (server.reject_every and server.recipients_seen % server.reject_every == 0
+                              and address not in server.rejected)
+                    if reject:
+                        server.rejected.add(address)
+                if reject:
+                    self.reply('451 try again later')
+                else:
+                    recipients.append(address)
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 end with <CRLF>.<CRLF>')
+                data = []
+                for raw in self.rfile:
+                    if raw in (b'.\r\n', b'.\n'):
+                        break
+                    data.append(raw)
+                with server.lock:
+                    server.messages.append((recipients, b''.join(data)))
+                if server.verbose:
+                    print(f"--- mail to {', '.join(recipients)}\n{b''.join(data).decode(errors='replace')}")
+                self.reply('250 OK queued')
+            elif verb in ('RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('502 not implemented')
+
+
+def start_sink(port=0, reject_every=0, verbose=False):
+    sink = SMTPSink(('127.0.0.1', port), reject_every, verbose)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+    return sink
+
+
+def run(args):
+    sink = start_sink(reject_every=args.reject_every)
+    tmp = tempfile.TemporaryDirectory()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp.name, 'outbox.db')}"
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    import app as A
+    flask_app = A.create_app({
+        'MAIL_SERVER': '127.0.0.1', 'MAIL_PORT': sink.server_address[1], 'MAIL_USE_TLS': False,
+        'MAIL_USERNAME': None, 'MAIL_PASSWORD': None, 'MAIL_DEFAULT_SENDER': 'leaves@bench.edu',
+        'OUTBOX_DISPATCHER': 'off', 'OUTBOX_BATCH_SIZE': args.batch_size, 'OUTBOX_RETRY_SECONDS': 0,
+    })
+    db = A.db
+    with flask_app.app_context():
+        db.create_all()
+        A.run_migrations()
+        faculty = A.User(name='Bench Faculty', email='faculty@bench.edu', password='-', role='faculty')
+        db.session.add(faculty)
+        db.session.flush()
+        db.session.execute(db.insert(A.Leave), [
+            {'student_id': faculty.id, 'name': f'Student {i}', 'email': f'student{i}@bench.edu', 'days': 1,
+             'reason': 'bench', 'status': 'Pending'} for i in range(args.leaves)])
+        db.session.commit()
+        faculty_id = faculty.id
+
+    client = flask_app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'], sess['role'], sess['name'] = faculty_id, 'faculty', 'Bench Faculty'
+    start = time.perf_counter()
+    response = client.post('/leaves/batch', json={'action': 'approve', 'filter': {'student_id': faculty_id}})
+    request_ms = (time.perf_counter() - start) * 1000
+
+    with flask_app.app_context():
+        start = time.perf_counter()
+        totals = [0, 0, 0]
+        while True:
+            for i, n in enumerate(A.notifications.dispatch()):
+                totals[i] += n
+            if not db.session.scalar(db.select(db.func.count()).select_from(A.OutboxMessage)
+                                     .where(A.OutboxMessage.status == 'pending')):
+                break
+        deliver_s = time.perf_counter() - start
+        statuses = dict(db.session.execute(db.select(A.OutboxMessage.status, db.func.count())
+                                           .group_by(A.OutboxMessage.status)).all())
+
+    print(f"approved {response.json['updated']} leaves in one request: {request_ms:.1f} ms")
+    print(f"delivered {len(sink.messages)} mails in {deliver_s:.2f}s "
+          f"({len(sink.messages) / max(deliver_s, 1e-9):.0f}/s) over {sink.connections} SMTP connections")
+    print(f"dispatch totals: {totals[0]} sent, {totals[1]} retried, {totals[2]} failed; outbox: {statuses}")
+    tmp.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--leaves', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=50, help="OUTBOX_BATCH_SIZE")
+    parser.add_argument('--reject-every', type=int, default=0, help="refuse every Kth recipient once")
+    parser.add_argument('--serve', type=int, metavar='PORT', help="only run the stand-in server")
+    args = parser.parse_args()
+
+    if args.serve:
+        start_sink(args.serve, args.reject_every, verbose=True)
+        print(f"stand-in SMTP listening on 127.0.0.1:{args.serve}, Ctrl-C to stop")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+        return
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
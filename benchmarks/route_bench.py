@@ -0,0 +1,262 @@
+"""
+Benchmark every route in app.py against a seeded synthetic database.
+
+For each route it reports latency percentiles, SQL statements per request and
+the peak Python memory of one request, and can save the results as a JSON
+baseline or compare against a previous one.
+
+    python benchmarks/route_bench.py --students 5000 --leaves 20000 --attendance 200000
+    python benchmarks/route_bench.py --save baseline.json
+    python benchmarks/route_bench.py --compare baseline.json     # exits 1 on a p50 regression
+    python benchmarks/route_bench.py --db /tmp/big.db --students 100000 --attendance 5000000
+
+--db keeps the seeded database so later runs with the same path skip seeding.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(db_path):
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.chdir(ROOT)
+    import app as application
+    # uploads and export job files go next to the database, not into the checkout
+    work_dir = os.path.dirname(db_path)
+    application.EXPORT_FOLDER = os.path.join(work_dir, 'exports')
+    # a broken route should show up as a 500 in the report, not abort the run;
+    # queued notifications stay in the outbox instead of going to a real SMTP server
+    return application, application.create_app({'PROPAGATE_EXCEPTIONS': False, 'OUTBOX_DISPATCHER': 'off',
+                                                'UPLOAD_FOLDER': os.path.join(work_dir, 'uploads')})
+
+
+def prepare_fixtures(flask_app, ids):
+    """Store a leave document and run one export job so their routes have something to serve."""
+    body = b'%PDF-1.4\n' + os.urandom(64 * 1024)
+    ids['document'] = f"{hashlib.sha256(body).hexdigest()}.pdf"
+    with open(os.path.join(flask_app.config['UPLOAD_FOLDER'], ids['document']), 'wb') as f:
+        f.write(body)
+
+    client = client_for(flask_app, 'admin', ids['admin_id'])
+    job = client.post('/admin/export-jobs', json={'dataset': 'users', 'format': 'csv'}).get_json()
+    deadline = time.monotonic() + 300
+    while job['status'] not in ('done', 'failed') and time.monotonic() < deadline:
+        time.sleep(0.05)
+        job = client.get(f"/admin/export-jobs/{job['id']}").get_json()
+    ids['export_job'] = job['id']
+    ids['asset'] = flask_app.extensions['assets'].url('css/login.css')
+
+
+IMPORT_CSV = ('name,email,role,password\n'
+              + ''.join(f'Import {n},import{n}@bench.edu,student,Bench@12345\n' for n in range(100))).encode()
+
+
+def routes(ids):
+    """(name, role, user id, method, path, form/json factory) for every route; the factory gets the iteration."""
+    admin, faculty, student = ids['admin_id'], ids['faculty_id'], ids['student_id']
+    job = ids['export_job']
+    return [
+        ('home', None, None, 'GET', '/', None),
+        ('login page', None, None, 'GET', '/login', None),
+        ('login', None, None, 'POST', '/login',
+         lambda i: {'data': {'email': 'student0@bench.edu', 'password': 'Bench@12345'}}),
+        ('register page', None, None, 'GET', '/register', None),
+        ('register', None, None, 'POST', '/register', lambda i: {'data': {}}),
+        ('forgot password page', None, None, 'GET', '/forgot-password', None),
+        ('asset', None, None, 'GET', ids['asset'], None),
+        ('student dashboard', 'student', student, 'GET', '/student', None),
+        ('apply leave', 'student', student, 'POST', '/student',
+         lambda i: {'data': {'full_name': 'Student 0', 'email': 'student0@bench.edu', 'days': '1', 'reason': 'bench'}}),
+        ('leave status', 'student', student, 'GET', '/leave-status', None),
+        ('leave document', 'student', student, 'GET', f"/documents/{ids['document']}", None),
+        ('faculty dashboard', 'faculty', faculty, 'GET', '/faculty', None),
+        ('faculty dashboard all', 'faculty', faculty, 'GET', '/faculty?status=all', None),
+        ('update attendance page', 'faculty', faculty, 'GET', '/update_attendance', None),
+        ('update attendance', 'faculty', faculty, 'POST', '/update_attendance',
+         lambda i: {'data': {'student_id': str(student), 'total_days': '20', 'present_days': str(10 + i % 10)}}),
+        ('bulk attendance (100 rows)', 'faculty', faculty, 'POST', '/update_attendance/bulk',
+         lambda i: {'json': [{'student_id': student, 'total_days': 20, 'present_days': 15}] * 100}),
+        ('record lecture', 'faculty', faculty, 'POST', '/attendance/lecture',
+         lambda i: {'json': {'lecture': f'bench-{i}', 'present': [student]}}),
+        ('batch decide leaves', 'faculty', faculty, 'POST', '/leaves/batch',
+         lambda i: {'json': {'action': 'approve', 'filter': {'student_id': student}}}),
+        ('admin dashboard', 'admin', admin, 'GET', '/admin', None),
+        ('admin leaves', 'admin', admin, 'GET', '/admin/leaves', None),
+        ('admin users', 'admin', admin, 'GET', '/admin/users', None),
+        ('admin attendance', 'admin', admin, 'GET', '/admin/attendance', None),
+        ('attendance pdf (all)', 'admin', admin, 'GET', '/admin/download-attendance-all', None),
+        ('attendance pdf (report)', 'admin', admin, 'GET', '/admin/download-attendance', None),
+        ('users pdf', 'admin', admin, 'GET', '/admin/export-users', None),
+        ('users csv', 'admin', admin, 'GET', '/admin/export/users.csv', None),
+        ('attendance csv', 'admin', admin, 'GET', '/admin/export/attendance.csv', None),
+        ('leaves ndjson', 'admin', admin, 'GET', '/admin/export/leaves.ndjson', None),
+        ('create export job', 'admin', admin, 'POST', '/admin/export-jobs',
+         lambda i: {'json': {'dataset': 'users', 'format': 'csv'}}),
+        ('export job status', 'admin', admin, 'GET', f'/admin/export-jobs/{job}', None),
+        ('export job download', 'admin', admin, 'GET', f'/admin/export-jobs/{job}/download', None),
+        ('import users (dry run)', 'admin', admin, 'POST', '/admin/users/import',
+         lambda i: {'data': {'file': (io.BytesIO(IMPORT_CSV), 'users.csv'), 'dry_run': '1'},
+                    'content_type': 'multipart/form-data'}),
+        ('metrics', 'admin', admin, 'GET', '/metrics', None),
+        ('api leaves', 'admin', admin, 'GET', '/api/leaves', None),
+        ('api attendance', 'admin', admin, 'GET', '/api/attendance', None),
+        ('api analytics', 'admin', admin, 'GET', '/api/analytics', None),
+        ('api search', 'admin', admin, 'GET', '/api/search?q=fever', None),
+        ('debug attendance', None, None, 'GET', '/debug/attendance', None),
+        ('logout', None, None, 'GET', '/logout', None),
+    ]
+
+
+def client_for(flask_app, role, user_id):
+    client = flask_app.test_client()
+    if role:
+        names = {'admin': 'Bench Admin', 'faculty': 'Faculty 0', 'student': 'Student 0'}
+        with client.session_transaction() as sess:
+            sess['user_id'], sess['role'], sess['name'] = user_id, role, names[role]
+    return client
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    k = (len(values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def bench_route(flask_app, route, iterations, statements):
+    name, role, user_id, method, path, payload = route
+    client = client_for(flask_app, role, user_id)
+
+    def call(i):
+        kwargs = payload(i) if payload else {}
+        response = client.open(path, method=method, **kwargs)
+        size = len(response.get_data())   # drains streamed responses
+        response.close()
+        return response.status_code, size
+
+    call(0)   # warm-up: template compilation, caches
+
+    tracemalloc.start()
+    call(1)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencies, counts = [], []
+    status = size = None
+    for i in range(iterations):
+        statements[0] = 0
+        start = time.perf_counter()
+        status, size = call(i + 2)
+        latencies.append((time.perf_counter() - start) * 1000)
+        counts.append(statements[0])
+
+    return {
+        'status': status,
+        'bytes': size,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'mean_ms': round(statistics.mean(latencies), 3),
+        'sql_per_request': round(statistics.mean(counts), 1),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = json.load(f)['routes']
+    regressions = []
+    print(f"\n{'route':<30} {'p50 before':>11} {'p50 now':>9} {'change':>8}")
+    for name, now in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        change = (now['p50_ms'] - before['p50_ms']) / max(before['p50_ms'], 0.001)
+        flag = ' <-- regression' if change > tolerance else ''
+        print(f"{name:<30} {before['p50_ms']:>11.2f} {now['p50_ms']:>9.2f} {change:>+8.0%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=1000)
+    parser.add_argument('--faculty', type=int, default=20)
+    parser.add_argument('--leaves', type=int, default=5000)
+    parser.add_argument('--attendance', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--login-iterations', type=int, default=3, help="login hashes a password, keep this low")
+    parser.add_argument('--only', help="substring filter on route names")
+    parser.add_argument('--db', help="database file to seed (or reuse if it exists)")
+    parser.add_argument('--save', help="write results to this JSON file")
+    parser.add_argument('--compare', help="baseline JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed p50 slowdown before failing")
+    args = parser.parse_args()
+
+    tmp = None
+    if args.db:
+        db_path = os.path.abspath(args.db)
+    else:
+        tmp = tempfile.TemporaryDirectory()
+        db_path = os.path.join(tmp.name, 'bench.db')
+    reuse = os.path.exists(db_path)
+
+    A, flask_app = load_app(db_path)
+    from seed_data import seed
+    from sqlalchemy import event
+
+    with flask_app.app_context():
+        if reuse:
+            ids = {'admin_id': A.User.query.filter_by(email='admin@bench.edu').first().id,
+                   'faculty_id': A.User.query.filter_by(email='faculty0@bench.edu').first().id,
+                   'student_id': A.User.query.filter_by(email='student0@bench.edu').first().id}
+            print(f"Reusing {db_path}")
+        else:
+            start = time.perf_counter()
+            ids = seed(A, args.students, args.faculty, args.leaves, args.attendance, args.seed)
+            print(f"Seeded {db_path} in {time.perf_counter() - start:.1f}s")
+    prepare_fixtures(flask_app, ids)
+
+    with flask_app.app_context():
+        statements = [0]
+        event.listen(A.db.engine, 'before_cursor_execute',
+                     lambda *a: statements.__setitem__(0, statements[0] + 1))
+
+    results = {}
+    print(f"\n{'route':<30} {'status':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'sql':>6} {'peak KB':>9}")
+    for route in routes(ids):
+        name = route[0]
+        if args.only and args.only not in name:
+            continue
+        iterations = args.login_iterations if name == 'login' else args.iterations
+        r = bench_route(flask_app, route, iterations, statements)
+        results[name] = r
+        print(f"{name:<30} {r['status']:>6} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} "
+              f"{r['sql_per_request']:>6} {r['peak_kb']:>9}")
+
+    A.hasher.shutdown()
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'params': vars(args), 'routes': results}, f, indent=2)
+        print(f"\nSaved {args.save}")
+    regressions = compare(results, args.compare, args.tolerance) if args.compare else []
+    if tmp:
+        tmp.cleanup()
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Seeded synthetic data for the benchmarks: students, faculty, leaves and
+attendance snapshots in realistic proportions, inserted with executemany in
+large chunks so millions of rows load in a reasonable time.
+
+Every generated account has the password BENCH_PASSWORD.
+"""
+import random
+from datetime import datetime, timedelta
+
+BENCH_PASSWORD = 'Bench@12345'
+CHUNK = 20000
+REASONS = ['fever', 'family function', 'medical appointment', 'sports event', 'travel', 'hackathon']
+
+
+def _chunks(rows, size=CHUNK):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed(A, students=1000, faculty=20, leaves=5000, attendance=20000, rng_seed=42):
+    """
+    Fill an empty database through the app module `A` (its models and db).
+    Returns a summary dict with the ids the benchmark needs.
+    """
+    rng = random.Random(rng_seed)
+    db = A.db
+    password = A.hasher.hash(BENCH_PASSWORD)   # one real hash, shared by every account
+    start = datetime(2025, 1, 6)
+
+    db.create_all()
+    A.run_migrations()
+
+    users = [{'name': 'Bench Admin', 'email': 'admin@bench.edu', 'password': password, 'role': 'admin'}]
+    users += [{'name': f'Faculty {i}', 'email': f'faculty{i}@bench.edu', 'password': password, 'role': 'faculty'}
+              for i in range(faculty)]
+    users += [{'name': f'Student {i}', 'email': f'student{i}@bench.edu', 'password': password, 'role': 'student'}
+              for i in range(students)]
+    for batch in _chunks(users):
+        db.session.execute(db.insert(A.User), batch)
+    db.session.commit()
+
+    ids = dict(db.session.execute(db.select(A.User.email, A.User.id)).all())
+    student_ids = [ids[f'student{i}@bench.edu'] for i in range(students)]
+    faculty_names = [f'Faculty {i}' for i in range(faculty)]
+
+    def leave_rows():
+        for _ in range(leaves):
+            n = rng.randrange(students)
+            status = rng.choices(['Pending', 'Approved', 'Rejected'], weights=[3, 5, 2])[0]
+            yield {'student_id': student_ids[n], 'name': f'Student {n}', 'email': f'student{n}@bench.edu',
+                   'days': rng.randint(1, 7), 'reason': rng.choice(REASONS), 'document': None, 'status': status,
+                   'approved_by': None if status == 'Pending' else rng.choice(faculty_names)}
+
+    for batch in _chunks(leave_rows()):
+        db.session.execute(db.insert(A.Leave), batch)
+        db.session.commit()
+
+    latest = {}
+
+    def attendance_rows():
+        # snapshots are spread evenly over the students, in time order
+        per_student = max(attendance // max(students, 1), 1)
+        produced = 0
+        for k in range(per_student):
+            for n, student_id in enumerate(student_ids):
+                if produced >= attendance:
+                    return
+                total = 10 + k
+                present = rng.randint(total // 2, total)
+                row = {'student_id': student_id, 'present_days': present, 'total_days': total,
+                       'percentage': round(100.0 * present / total, 2), 'updated_by': rng.choice(faculty_names),
+                       'updated_at': start + timedelta(days=k, seconds=n)}
+                latest[student_id] = row
+                produced += 1
+                yield row
+
+    for batch in _chunks(attendance_rows()):
+        db.session.execute(db.insert(A.Attendance), batch)
+        db.session.commit()
+
+    for batch in _chunks(latest.values()):
+        db.session.execute(db.insert(A.AttendanceRollup), [
+            {'student_id': r['student_id'], 'present_count': r['present_days'], 'total_count': r['total_days'],
+             'percentage': r['percentage'], 'updated_at': r['updated_at']} for r in batch])
+        db.session.commit()
+
+    return {
+        'admin_id': ids['admin@bench.edu'],
+        'faculty_id': ids['faculty0@bench.edu'] if faculty else None,
+        'student_id': student_ids[0] if student_ids else None,
+    }
@@ -0,0 +1,104 @@
+"""
+Worker startup cost: how long a fresh interpreter takes to import app.py and
+build the Flask app, how long its first request takes, and how much resident
+memory it holds afterwards. Each run is a new process, like a gunicorn worker
+booting without --preload.
+
+    python benchmarks/startup_bench.py --runs 10
+    python benchmarks/startup_bench.py --compare HEAD~1    # the same numbers for an older revision
+
+--compare extracts the revision with `git archive` into a temporary directory.
+Revisions from before create_app() are measured through their module-level app.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# runs inside the measured process, with the source tree as cwd
+PROBE = r'''
+import json, os, sys, time
+sys.path.insert(0, os.getcwd())
+start = time.perf_counter()
+import app as module
+imported = time.perf_counter()
+flask_app = module.create_app() if hasattr(module, 'create_app') else module.app
+built = time.perf_counter()
+response = flask_app.test_client().get('/login')
+served = time.perf_counter()
+
+def rss_kb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'build_ms': (built - imported) * 1000,
+    'first_request_ms': (served - built) * 1000,
+    'rss_mb': rss_kb() / 1024,
+    'modules': len(sys.modules),
+    'status': response.status_code,
+}))
+'''
+
+FIELDS = ('import_ms', 'build_ms', 'startup_ms', 'first_request_ms', 'rss_mb', 'modules')
+
+
+def sample(tree, db_dir):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(db_dir, 'startup.db')}")
+    out = subprocess.run([sys.executable, '-c', PROBE], cwd=tree, env=env, check=True,
+                         capture_output=True, text=True).stdout
+    result = json.loads(out.strip().splitlines()[-1])
+    result['startup_ms'] = result['import_ms'] + result['build_ms']
+    return result
+
+
+def measure(trees, runs, db_dir):
+    """Median per tree; trees are sampled in turn so machine noise hits them alike."""
+    samples = {name: [] for name in trees}
+    for _ in range(runs):
+        for name, tree in trees.items():
+            samples[name].append(sample(tree, db_dir))
+    return {name: {field: statistics.median(s[field] for s in runs_) for field in FIELDS}
+            for name, runs_ in samples.items()}
+
+
+def extract(rev, target):
+    archive = subprocess.run(['git', 'archive', rev], cwd=ROOT, check=True, capture_output=True).stdout
+    subprocess.run(['tar', 'xf', '-'], cwd=target, input=archive, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--compare', metavar='REV', help="also measure this git revision")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        trees = {'working tree': ROOT}
+        if args.compare:
+            trees[args.compare] = os.path.join(tmp, 'rev')
+            os.makedirs(trees[args.compare])
+            extract(args.compare, trees[args.compare])
+        results = measure(trees, args.runs, tmp)
+
+    print(f"median of {args.runs} fresh processes")
+    print(f"{'':<14}" + ''.join(f"{field:>18}" for field in FIELDS))
+    for name, r in results.items():
+        print(f"{name:<14}" + ''.join(f"{r[field]:>18.1f}" for field in FIELDS))
+    if args.compare:
+        now, before = results['working tree'], results[args.compare]
+        print(f"{'change':<14}" + ''.join(f"{now[f] - before[f]:>+18.1f}" for f in FIELDS))
+
+
+if __name__ == '__main__':
+    main()
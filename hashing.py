@@ -0,0 +1,120 @@
+"""
+Password hashing off the request thread.
+
+pbkdf2 with 1,000,000 iterations costs a large part of a CPU second per call,
+so hashes are computed in a process pool sized to the machine's cores. The
+number of hashes queued or running at once is bounded; when the bound is hit
+the caller gets HasherBusy immediately instead of piling up behind the pool.
+A hash that does not finish within the timeout also raises HasherBusy; its
+slot stays taken until the worker is done with it.
+
+Config keys (all optional):
+    PASSWORD_HASH_METHOD   werkzeug method string, e.g. 'pbkdf2:sha256:1000000'
+    PASSWORD_HASH_WORKERS  pool size, defaults to os.cpu_count(); 0 hashes inline
+    PASSWORD_HASH_QUEUE    max hashes in flight per process, defaults to 4 x workers
+    PASSWORD_HASH_TIMEOUT  seconds to wait for a result, defaults to 10
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+DEFAULT_METHOD = f'pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}'
+
+
+class HasherBusy(Exception):
+    """Raised when too many hashes are already queued, or one did not finish in time."""
+
+
+def normalize_method(method):
+    """Spell out werkzeug's implicit defaults so stored hash prefixes can be compared."""
+    name, *args = method.split(':')
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    if name == 'scrypt':
+        n, r, p = map(int, args) if args else (2 ** 15, 8, 1)
+        return f'scrypt:{n}:{r}:{p}'
+    return method
+
+
+class PasswordHasher:
+    def __init__(self, app=None):
+        self.method = DEFAULT_METHOD
+        self.workers = os.cpu_count() or 1
+        self.max_in_flight = 4 * self.workers
+        self.timeout = 10
+        self._pool = None
+        self._pool_pid = None
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.method = normalize_method(app.config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD))
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+        self.max_in_flight = app.config.get('PASSWORD_HASH_QUEUE', 4 * max(self.workers, 1))
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', 10)
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        app.extensions['password_hasher'] = self
+
+    def _executor(self):
+        # a pool inherited through fork (e.g. gunicorn preload) is unusable, so one is made per process
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            future = self._executor().submit(fn, *args)
+        except BaseException:
+            slots.release()
+            raise
+        # freed when the worker finishes, not when the caller gives up waiting
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise HasherBusy() from None
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def check(self, stored_hash, password):
+        return self._run(check_password_hash, stored_hash, password)
+
+    def hash_many(self, passwords, chunksize=16):
+        """
+        Hash a batch of passwords across the whole pool, in order. Meant for bulk
+        imports: it holds one in-flight slot but keeps every worker busy, so
+        logins queue behind it until it finishes.
+        """
+        methods = [self.method] * len(passwords)
+        if not self.workers:
+            return list(map(generate_password_hash, passwords, methods))
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            return list(self._executor().map(generate_password_hash, passwords, methods, chunksize=chunksize))
+        finally:
+            self._slots.release()
+
+    def needs_rehash(self, stored_hash):
+        """True when the stored hash was made with parameters other than the current policy."""
+        return stored_hash.split('$', 1)[0] != self.method
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown()
+            self._pool = None
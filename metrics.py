@@ -0,0 +1,170 @@
+"""
+Per-request performance metrics in Prometheus text format.
+
+Records, per route: latency, response size, number and total time of SQL
+statements, and template render time. Requests that run the same SQL
+statement REPEATED_QUERY_THRESHOLD times or more are counted and logged,
+which is how N+1 loops show up. Statements that bind a list of values in an
+IN (...) are batched lookups (see SQL_IN_CHUNK in app.py), not N+1, and are
+left out of that check. Metrics are kept per process, so with
+several gunicorn workers each worker reports its own numbers.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import g, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1024, 10240, 102400, 1048576, 10485760)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 500)
+REPEATED_QUERY_THRESHOLD = 5
+# IN (?, ?, ...) with two or more bound parameters, in any DB-API paramstyle
+_PARAM = r'(?:\?|%s|%\(\w+\)s|:\w+|\$\d+)'
+_BOUND_IN_LIST = re.compile(rf'\bIN\s*\(\s*{_PARAM}(?:\s*,\s*{_PARAM})+\s*\)', re.IGNORECASE)
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+
+
+def _labels(pairs):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{k}="{escape(v)}"' for k, v in pairs)
+
+
+class Metrics:
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._histograms = {}   # (name, labels) -> _Histogram
+        self._counters = defaultdict(float)   # (name, labels) -> value
+        self._help = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        app.extensions['metrics'] = self
+
+    def instrument_engine(self, engine):
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    # ---- recording ----
+    def observe(self, name, labels, value, buckets, help_text):
+        with self._lock:
+            self._help.setdefault(name, ('histogram', help_text))
+            key = (name, labels)
+            if key not in self._histograms:
+                self._histograms[key] = _Histogram(buckets)
+            self._histograms[key].observe(value)
+
+    def inc(self, name, labels, value=1, help_text=''):
+        with self._lock:
+            self._help.setdefault(name, ('counter', help_text))
+            self._counters[(name, labels)] += value
+
+    # ---- hooks ----
+    def _before_request(self):
+        g._metrics_start = time.perf_counter()
+        g._metrics_sql = Counter()
+        g._metrics_sql_batched = 0
+        g._metrics_sql_time = 0.0
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and '_metrics_sql' in g:
+            if _BOUND_IN_LIST.search(statement):
+                g._metrics_sql_batched += 1
+            else:
+                g._metrics_sql[statement] += 1
+            conn.info.setdefault('_metrics_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('_metrics_started')
+        if started and has_request_context() and '_metrics_sql' in g:
+            g._metrics_sql_time += time.perf_counter() - started.pop()
+
+    def _before_render(self, sender, template, context, **extra):
+        if has_request_context():
+            g._metrics_render_start = time.perf_counter()
+
+    def _after_render(self, sender, template, context, **extra):
+        start = g.pop('_metrics_render_start', None) if has_request_context() else None
+        if start is not None:
+            self.observe('template_render_seconds', _labels([('template', template.name)]),
+                         time.perf_counter() - start, LATENCY_BUCKETS, "Template render time.")
+
+    def _after_request(self, response):
+        start = g.pop('_metrics_start', None)
+        if start is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        labels = _labels([('route', route), ('method', request.method)])
+
+        self.observe('http_request_duration_seconds', labels, time.perf_counter() - start,
+                     LATENCY_BUCKETS, "Request latency until the response starts.")
+        self.inc('http_requests_total', _labels([('route', route), ('method', request.method),
+                                                 ('status', response.status_code)]),
+                 help_text="Requests served.")
+        if response.content_length is not None:
+            self.observe('http_response_size_bytes', labels, response.content_length,
+                         SIZE_BUCKETS, "Response body size (streamed responses are not counted).")
+
+        statements = g.pop('_metrics_sql', Counter())
+        self.observe('db_statements_per_request', labels,
+                     sum(statements.values()) + g.pop('_metrics_sql_batched', 0),
+                     STATEMENT_BUCKETS, "SQL statements executed per request.")
+        self.inc('db_statement_seconds_total', labels, g.pop('_metrics_sql_time', 0.0),
+                 help_text="Time spent in SQL statements.")
+
+        repeated = [(sql, n) for sql, n in statements.items() if n >= REPEATED_QUERY_THRESHOLD]
+        if repeated:
+            self.inc('http_repeated_query_requests_total', labels,
+                     help_text="Requests that ran one SQL statement repeatedly (likely N+1).")
+            sql, n = max(repeated, key=lambda item: item[1])
+            logger.warning("%s %s ran the same query %d times: %s", request.method, route, n,
+                           ' '.join(sql.split())[:200])
+        return response
+
+    # ---- exposition ----
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in sorted(self._help.items()):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                if kind == 'histogram':
+                    for (metric, labels), h in sorted(self._histograms.items()):
+                        if metric != name:
+                            continue
+                        sep = ',' if labels else ''
+                        for bound, count in zip(h.buckets, h.counts):
+                            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {count}')
+                        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {h.total}')
+                        lines.append(f'{name}_sum{{{labels}}} {h.sum}')
+                        lines.append(f'{name}_count{{{labels}}} {h.total}')
+                else:
+                    for (metric, labels), value in sorted(self._counters.items()):
+                        if metric == name:
+                            lines.append(f'{name}{{{labels}}} {value}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,195 @@
+"""
+Notification mail through a transactional outbox.
+
+Request handlers never talk to SMTP. They queue OutboxMessage rows in the
+same commit as the change the mail is about, so a decision is never saved
+without its notification and vice versa. A dispatcher drains the table: it
+claims a batch of due messages, sends them over one SMTP connection and
+records each outcome. Failed messages are retried with exponential backoff
+and marked 'failed' after OUTBOX_MAX_ATTEMPTS.
+
+A claim is a lease. Rows left in 'sending' by a worker that died mid-batch
+become due again when the lease runs out, so delivery is at least once.
+
+Config keys (all optional):
+    OUTBOX_DISPATCHER     'thread' drains in a background thread in each worker (default),
+                          'off' leaves it to `flask send-notifications`
+    OUTBOX_BATCH_SIZE     messages per SMTP connection, defaults to 50
+    OUTBOX_POLL_SECONDS   how often the thread looks for due retries, defaults to 5
+    OUTBOX_MAX_ATTEMPTS   attempts before a message is given up on, defaults to 8
+    OUTBOX_RETRY_SECONDS  delay before the first retry, doubled per attempt, defaults to 30
+    OUTBOX_LEASE_SECONDS  how long a claimed batch stays reserved, defaults to 300
+"""
+import logging
+import os
+import smtplib
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# errors that concern one message; anything else from SMTP ends the connection
+_MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+def get_mail(app):
+    """The app's Flask-Mail state, importing and initialising Flask-Mail on first use."""
+    if 'mail' not in app.extensions:
+        from flask_mail import Mail
+        Mail(app)
+    return app.extensions['mail']
+
+
+class NotificationDispatcher:
+    def __init__(self, db, model, app=None):
+        self.db = db
+        self.model = model
+        self.mode = 'thread'
+        self.batch_size = 50
+        self.poll_seconds = 5
+        self.max_attempts = 8
+        self.retry_seconds = 30
+        self.lease_seconds = 300
+        self._app = None
+        self._wake = threading.Event()
+        self._thread_pid = None
+        self._lock = threading.Lock()
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_rollback', self._after_rollback)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.mode = app.config.get('OUTBOX_DISPATCHER', 'thread')
+        self.batch_size = app.config.get('OUTBOX_BATCH_SIZE', 50)
+        self.poll_seconds = app.config.get('OUTBOX_POLL_SECONDS', 5)
+        self.max_attempts = app.config.get('OUTBOX_MAX_ATTEMPTS', 8)
+        self.retry_seconds = app.config.get('OUTBOX_RETRY_SECONDS', 30)
+        self.lease_seconds = app.config.get('OUTBOX_LEASE_SECONDS', 300)
+        self._app = app
+        if self.mode == 'thread':
+            app.before_request(self._ensure_thread)
+        app.extensions['notifications'] = self
+
+    # ---- queueing (inside the caller's transaction) ----
+    def queue(self, recipient, subject, body):
+        self.db.session.add(self.model(recipient=recipient, subject=subject, body=body))
+        self.db.session.info['outbox_queued'] = True
+
+    def queue_many(self, messages):
+        """Queue dicts with recipient, subject and body in one INSERT."""
+        if messages:
+            self.db.session.execute(self.db.insert(self.model), messages)
+            self.db.session.info['outbox_queued'] = True
+
+    def _after_commit(self, sess):
+        if sess.info.pop('outbox_queued', False):
+            self._wake.set()
+
+    def _after_rollback(self, sess):
+        sess.info.pop('outbox_queued', None)
+
+    # ---- background thread ----
+    def _ensure_thread(self):
+        # a thread started before a fork (e.g. gunicorn preload) does not exist in the child
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid != os.getpid():
+                threading.Thread(target=self._run, args=(self._app,), name='outbox', daemon=True).start()
+                self._thread_pid = os.getpid()
+
+    def _run(self, app):
+        self._wake.set()   # drain whatever is due right away
+        while True:
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+            try:
+                with app.app_context():
+                    self.dispatch()
+            except Exception:
+                logger.exception("Notification dispatch failed")
+
+    # ---- delivery ----
+    def dispatch(self):
+        """Send every due message, one SMTP connection per batch. Returns (sent, retrying, failed)."""
+        totals = [0, 0, 0]
+        while True:
+            batch = self._claim()
+            if not batch:
+                return tuple(totals)
+            for i, n in enumerate(self._deliver(batch)):
+                totals[i] += n
+
+    def _due(self, now):
+        M = self.model
+        return M.status.in_(('pending', 'sending')) & (M.next_attempt_at <= now)
+
+    def _claim(self):
+        db, M = self.db, self.model
+        now = datetime.utcnow()
+        # a plain read first, so idle polls never take the write lock
+        if db.session.scalar(db.select(M.id).where(self._due(now)).limit(1)) is None:
+            db.session.rollback()
+            return []
+        db.session.commit()
+        ids = db.select(M.id).where(self._due(now)).order_by(M.id).limit(self.batch_size)
+        batch = db.session.execute(
+            db.update(M).where(M.id.in_(ids.scalar_subquery()))
+            .values(status='sending', next_attempt_at=now + timedelta(seconds=self.lease_seconds))
+            .returning(M.id, M.recipient, M.subject, M.body, M.attempts)
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.session.commit()
+        return batch
+
+    def _send(self, batch):
+        """Send over one connection. Returns {id: None on success, else the error text}."""
+        from flask_mail import Message
+        mail = get_mail(current_app._get_current_object())
+        outcome = {}
+        try:
+            with mail.connect() as conn:
+                for row in batch:
+                    try:
+                        conn.send(Message(row.subject, recipients=[row.recipient], body=row.body))
+                        outcome[row.id] = None
+                    except _MESSAGE_ERRORS as e:
+                        outcome[row.id] = str(e)
+        except (smtplib.SMTPException, OSError) as e:
+            logger.warning("SMTP connection failed after %d of %d messages: %s", len(outcome), len(batch), e)
+            for row in batch:
+                outcome.setdefault(row.id, str(e))
+        return outcome
+
+    def _deliver(self, batch):
+        db, M = self.db, self.model
+        outcome = self._send(batch)
+        now = datetime.utcnow()
+        sent = [row.id for row in batch if outcome[row.id] is None]
+        retrying = failed = 0
+        if sent:
+            db.session.execute(db.update(M).where(M.id.in_(sent)).values(status='sent', sent_at=now)
+                               .execution_options(synchronize_session=False))
+        for row in batch:
+            error = outcome[row.id]
+            if error is None:
+                continue
+            attempts = row.attempts + 1
+            if attempts >= self.max_attempts:
+                values = {'status': 'failed'}
+                failed += 1
+            else:
+                delay = self.retry_seconds * 2 ** (attempts - 1)
+                values = {'status': 'pending', 'next_attempt_at': now + timedelta(seconds=delay)}
+                retrying += 1
+            db.session.execute(db.update(M).where(M.id == row.id)
+                               .values(attempts=attempts, last_error=error[:500], **values)
+                               .execution_options(synchronize_session=False))
+        db.session.commit()
+        if retrying or failed:
+            logger.warning("Outbox batch: %d sent, %d to retry, %d failed", len(sent), retrying, failed)
+        return len(sent), retrying, failed
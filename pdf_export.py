@@ -0,0 +1,122 @@
+"""
+Streaming table-to-PDF renderer used by the admin export routes.
+
+Unlike reportlab's canvas, which keeps every page in memory until save(),
+this writer emits each page as soon as it is full, so memory stays flat no
+matter how many rows are exported. It only supports what the exports need:
+the two standard Helvetica fonts and left-aligned text on US letter pages.
+"""
+import zlib
+from collections import namedtuple
+
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792   # US letter, in points
+
+# title: header text of the column, x: left edge in points,
+# max_chars: longer values are cut and suffixed with '...' (None = never cut)
+Column = namedtuple('Column', ['title', 'x', 'max_chars'])
+
+_REGULAR, _BOLD = 'F1', 'F2'
+
+
+def _escape(text):
+    data = str(text).encode('cp1252', errors='replace')
+    return data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+def _truncate(value, max_chars):
+    value = '' if value is None else str(value)
+    if max_chars is not None and len(value) > max_chars:
+        return value[:max_chars] + '...'
+    return value
+
+
+class _PdfWriter:
+    """Writes PDF objects sequentially and remembers their byte offsets for the xref table."""
+
+    def __init__(self):
+        self.offset = 0
+        self.offsets = {}
+
+    def raw(self, data):
+        self.offset += len(data)
+        return data
+
+    def obj(self, num, body, stream=None):
+        self.offsets[num] = self.offset
+        out = b'%d 0 obj\n' % num + body
+        if stream is not None:
+            out += b'\nstream\n' + stream + b'\nendstream'
+        out += b'\nendobj\n'
+        return self.raw(out)
+
+
+def stream_table_pdf(title, columns, rows, title_x=40, title_size=14, header_size=10,
+                     body_size=9, title_gap=25, header_gap=18, row_height=16,
+                     margin=40, bottom=60, repeat_header=True):
+    """
+    Render rows (iterables of values, one per column) as a paginated table.
+    columns are Column tuples or plain (title, x, max_chars) tuples.
+
+    Yields the PDF in chunks: the file header first, then one chunk per
+    finished page, then the page tree and xref table.
+    """
+    columns = [Column(*c) for c in columns]
+    pdf = _PdfWriter()
+    yield pdf.raw(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    yield pdf.obj(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    yield pdf.obj(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+    yield pdf.obj(4, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>')
+
+    next_obj = 5
+    page_ids = []
+    ops = []
+
+    def text(font, size, x, y, value):
+        ops.append(b'BT /%s %d Tf %.2f %.2f Td (%s) Tj ET' % (font.encode(), size, x, y, _escape(value)))
+
+    def header(y):
+        for col in columns:
+            text(_BOLD, header_size, col.x, y, col.title)
+        return y - header_gap
+
+    def finish_page():
+        nonlocal next_obj
+        content = zlib.compress(b'\n'.join(ops))
+        content_id, page_id = next_obj, next_obj + 1
+        next_obj += 2
+        page_ids.append(page_id)
+        ops.clear()
+        return (
+            pdf.obj(content_id, b'<< /Length %d /Filter /FlateDecode >>' % len(content), content)
+            + pdf.obj(page_id, b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] '
+                               b'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> '
+                               b'/Contents %d 0 R >>' % (PAGE_WIDTH, PAGE_HEIGHT, content_id))
+        )
+
+    y = PAGE_HEIGHT - margin
+    text(_BOLD, title_size, title_x, y, title)
+    y = header(y - title_gap)
+
+    for row in rows:
+        for col, value in zip(columns, row):
+            text(_REGULAR, body_size, col.x, y, _truncate(value, col.max_chars))
+        y -= row_height
+        if y < bottom:
+            yield finish_page()
+            y = PAGE_HEIGHT - margin
+            if repeat_header:
+                y = header(y)
+
+    if ops or not page_ids:
+        yield finish_page()
+
+    kids = b' '.join(b'%d 0 R' % pid for pid in page_ids)
+    yield pdf.obj(2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(page_ids)))
+
+    xref_at = pdf.offset
+    size = next_obj
+    xref = [b'xref\n0 %d\n' % size, b'0000000000 65535 f \n']
+    for num in range(1, size):
+        xref.append(b'%010d 00000 n \n' % pdf.offsets[num])
+    xref.append(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (size, xref_at))
+    yield pdf.raw(b''.join(xref))
@@ -0,0 +1,66 @@
+"""
+Content-addressed storage for leave documents.
+
+Uploads are streamed to a temporary file in fixed-size chunks while being
+hashed, then renamed to "<sha256>.<ext>". Identical files are therefore kept
+once, and different files can never overwrite each other the way two
+uploads with the same secure_filename() used to.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+CHUNK_SIZE = 64 * 1024
+_STORED_NAME = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]+$')
+
+
+class UploadRejected(Exception):
+    """The upload is too large or of a type that is not allowed."""
+
+
+def extension_of(filename):
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+
+def is_content_addressed(name):
+    return bool(_STORED_NAME.match(name))
+
+
+def save_upload(file, folder, max_bytes, allowed_extensions):
+    """
+    Store a werkzeug FileStorage under its content hash and return the stored name.
+    Raises UploadRejected (leaving nothing behind) on a bad extension or when
+    more than max_bytes arrive.
+    """
+    ext = extension_of(file.filename or '')
+    if ext not in allowed_extensions:
+        raise UploadRejected(f"File type '.{ext}' is not allowed.")
+
+    os.makedirs(folder, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = file.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadRejected(f"File is larger than {max_bytes // (1024 * 1024)} MB.")
+                digest.update(chunk)
+                out.write(chunk)
+
+        name = f"{digest.hexdigest()}.{ext}"
+        path = os.path.join(folder, name)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+        return name
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
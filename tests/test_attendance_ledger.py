@@ -0,0 +1,62 @@
+import os
+import shutil
+import sys
+from datetime import datetime
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import app as A   # noqa: E402
+
+LEGACY_DB = os.path.join(ROOT, 'instance', 'users.db')
+LEGACY_STUDENT = 4   # one snapshot at 100.0%, written before snapshots kept day counts
+
+
+@pytest.fixture
+def legacy_app(tmp_path):
+    """The shipped database, from before the attendance ledger, migrated to the current schema."""
+    db_path = tmp_path / 'users.db'
+    shutil.copy(LEGACY_DB, db_path)
+    flask_app = A.create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}', 'TESTING': True,
+                              'UPLOAD_FOLDER': str(tmp_path / 'uploads'), 'OUTBOX_DISPATCHER': 'off'})
+    with flask_app.app_context():
+        A.prepare_database()
+        yield flask_app
+        A.db.session.remove()
+        A.db.engine.dispose()
+
+
+def rollup(student_id):
+    A.db.session.expire_all()
+    row = A.db.session.get(A.AttendanceRollup, student_id)
+    return row.present_count, row.total_count, row.percentage
+
+
+def test_migration_keeps_legacy_percentage(legacy_app):
+    assert rollup(LEGACY_STUDENT) == (0, 0, 100.0)
+
+
+@pytest.mark.parametrize('present', [True, False])
+def test_lecture_after_migration_keeps_legacy_percentage(legacy_app, present):
+    A.record_lecture_attendance('L1', {LEGACY_STUDENT: present}, 'Faculty')
+    A.db.session.commit()
+    assert rollup(LEGACY_STUDENT) == (0, 0, 100.0)
+
+    # correcting the mark must not move it either
+    A.record_lecture_attendance('L1', {LEGACY_STUDENT: not present}, 'Faculty')
+    A.db.session.commit()
+    assert rollup(LEGACY_STUDENT) == (0, 0, 100.0)
+
+
+def test_lectures_count_again_after_a_snapshot_with_days(legacy_app):
+    A.record_lecture_attendance('L1', {LEGACY_STUDENT: False}, 'Faculty')
+    A.record_attendance_snapshots([{'student_id': LEGACY_STUDENT, 'present_days': 9, 'total_days': 10,
+                                    'percentage': 90.0, 'updated_by': 'Faculty', 'updated_at': datetime.utcnow()}])
+    A.db.session.commit()
+    assert rollup(LEGACY_STUDENT) == (9, 10, 90.0)
+
+    A.record_lecture_attendance('L2', {LEGACY_STUDENT: False}, 'Faculty')
+    A.db.session.commit()
+    assert rollup(LEGACY_STUDENT) == (9, 11, 81.82)